@@ -0,0 +1,182 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+import checkpoints
+import logs
+import metrics
+import pacing
+
+log = logs.get_logger("api_fetch")
+
+# Pages requested at once (and keep-alive connections pooled) per run
+API_WORKERS = int(os.environ.get("SCRAPER_API_WORKERS", "8"))
+
+# Statuses worth retrying; any other error status means the endpoint changed
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class ApiError(Exception):
+    """The listing API kept failing, or its JSON no longer has the fields the scraper maps"""
+
+
+def create_session(pool_size=API_WORKERS):
+    """requests.Session keeping up to pool_size keep-alive connections per host, asking for gzip JSON"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip, deflate"})
+    return session
+
+
+def records_from_payload(payload, record, fields):
+    """(total_pages, records) from one listing page; ApiError if the JSON does not fit fields"""
+    if not isinstance(payload, dict) or not isinstance(payload.get("items"), list):
+        raise ApiError("response has no items list")
+    total_pages = payload.get("total_pages")
+    if not isinstance(total_pages, int) or isinstance(total_pages, bool):
+        raise ApiError("response has no integer total_pages")
+
+    records = []
+    for i, item in enumerate(payload["items"], start=1):
+        if not isinstance(item, dict):
+            raise ApiError(f"item {i} is not an object")
+        missing = [field for field in fields if not isinstance(item.get(field), str)]
+        if missing:
+            raise ApiError(f"item {i} has no text {', '.join(missing)}")
+        records.append(record(*(item[field].strip() for field in fields)))
+    return total_pages, records
+
+
+class ListingApi:
+    """Fetch a client-rendered listing straight from the JSON endpoint its page calls
+
+    url_template is the endpoint with a {page} field; each item's fields, in
+    order, become one record (the same namedtuple the browser path yields).
+    Pages are fetched up to `workers` at a time over one pooled session, with
+    waits, retries and concurrency going through pacer. Anything unexpected
+    (an error status, a failed request, non-JSON, a missing field) raises
+    ApiError so the caller can fall back to the browser.
+    """
+
+    def __init__(self, url_template, record, fields, workers=API_WORKERS, pacer=None):
+        self.url_template = url_template
+        self.record = record
+        self.fields = tuple(fields)
+        self.workers = max(1, workers)
+        self.pacer = pacer or pacing.Pacer("api")
+        self.pacer.max_concurrency = max(self.pacer.max_concurrency, self.workers)
+        self.session = create_session(self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.session.close()
+        return False
+
+    @metrics.timed("fetch_api_page", rows=lambda result: len(result[1]))
+    def fetch(self, page):
+        """GET one page, returning (total_pages, records)"""
+        url = self.url_template.format(page=page)
+        error = None
+        for _ in self.pacer.attempts():
+            try:
+                with self.pacer.slot():
+                    started = time.perf_counter()
+                    response = self.session.get(url, timeout=self.pacer.timeout)
+            except requests.Timeout as e:
+                self.pacer.failure("timeout")
+                error = e
+                continue
+            except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                # Dropped connections and bodies cut off mid-transfer are worth another try
+                self.pacer.failure("connection_error")
+                error = e
+                continue
+            except requests.RequestException as e:
+                # Redirect loops, bad URLs, undecodable bodies: retrying will not help
+                raise ApiError(f"{url} request failed: {e}") from e
+
+            if response.status_code in RETRY_STATUSES:
+                self.pacer.failure(f"http_{response.status_code}")
+                error = f"HTTP {response.status_code}"
+                continue
+            if response.status_code != 200:
+                raise ApiError(f"{url} answered HTTP {response.status_code}")
+            self.pacer.observe(time.perf_counter() - started)
+
+            try:
+                payload = response.json()
+            except ValueError:
+                raise ApiError(f"{url} did not return JSON")
+            return records_from_payload(payload, self.record, self.fields)
+
+        raise ApiError(f"{url} failed after {self.pacer.max_attempts} attempts: {error}")
+
+    def pages(self, first_page, last_page):
+        """Yield (page, records) from first_page up to last_page (or the last page) in order
+
+        The first page is fetched alone to learn total_pages; after that up to
+        `workers` pages are in flight while earlier ones are consumed.
+        """
+        total_pages, records = self.fetch(first_page)
+        yield first_page, records
+        last_page = min(last_page, total_pages)
+
+        pending = deque()
+        page = first_page + 1
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                while pending or page <= last_page:
+                    while page <= last_page and len(pending) < self.workers:
+                        pending.append((page, pool.submit(self.fetch, page)))
+                        page += 1
+                    page_number, future = pending.popleft()
+                    yield page_number, future.result()[1]
+            finally:
+                # A consumer that stops early leaves at most the running requests to finish
+                for _, future in pending:
+                    future.cancel()
+
+    def save_pages(self, save, sink, scraper, target_url, max_pages, check_stored=True, incremental=False,
+                   resume=False):
+        """Stream pages through save(sink, records, check_stored) as the browser loop does
+
+        Returns None once the listing is done (clearing its checkpoint), or the
+        page the browser should continue from if the API failed.
+        """
+        next_page = 1
+        if resume:
+            checkpoint = checkpoints.load(scraper, target_url)
+            if checkpoint:
+                log.info("Resuming %s after page %s", scraper, checkpoint[0])
+                next_page = checkpoint[0] + 1
+        if next_page > max_pages:
+            checkpoints.finish(sink, scraper, target_url)
+            return None
+
+        try:
+            for page_number, records in self.pages(next_page, max_pages):
+                metrics.set_page(page_number)
+                seen, new_count, _ = save(sink, records, check_stored)
+                if not seen:
+                    log.info("No items found on page %s.", page_number)
+                    break
+
+                sink.checkpoint(scraper, target_url, page_number, seen)
+                next_page = page_number + 1
+                log.info("Page %s: %s rows, %s new from the API", page_number, seen, new_count,
+                         extra={"page": page_number, "rows": seen, "new_rows": new_count})
+                if incremental and new_count == 0:
+                    log.info("Only already-stored rows on this page, stopping.")
+                    break
+        except ApiError as e:
+            log.warning("Listing API failed at page %s (%s); continuing in the browser", next_page, e,
+                        extra={"page": next_page})
+            return next_page
+        checkpoints.finish(sink, scraper, target_url)
+        return None
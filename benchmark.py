@@ -0,0 +1,259 @@
+import argparse
+import json
+import sys
+import time
+import uuid
+import api_fetch
+import command_trace
+import db
+import scraper1
+import scraper2
+import scraper3
+import scraper4
+import driver_factory
+import metrics
+from bulk_sink import CopySink
+from db_writer import BackgroundWriter
+from fixture_site import FixtureSite
+from prefetch import TabPrefetcher
+from records import Listing, SellerListing
+from selenium.webdriver.common.by import By
+
+
+class TimedCopySink(CopySink):
+    """CopySink that adds up the wall time spent in flushes"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.write_seconds = 0.0
+
+    def flush(self):
+        started = time.perf_counter()
+        try:
+            return super().flush()
+        finally:
+            self.write_seconds += time.perf_counter() - started
+
+
+def prefetcher(driver, site, path, prefetch, ready_locator, go_to_next_page):
+    """TabPrefetcher over the fixture's paginated path; click-through only unless prefetch"""
+    template = f"{site.base_url}{path}?page={{page}}" if prefetch else None
+    return TabPrefetcher(driver, template, ready_locator, go_to_next_page)
+
+
+def run_scraper1(driver, site, sink, baseline, prefetch):
+    driver.get(f"{site.base_url}/quasar")
+    pages = prefetcher(driver, site, "/quasar", prefetch, (By.XPATH, f'{scraper1.LIST_XPATH}[1]'), scraper1.go_to_next_page)
+    rows = []
+    for page in range(1, site.pages + 1):
+        metrics.set_page(page)
+        if page < site.pages:
+            pages.prefetch(page + 1)
+        listings = scraper1.scrape_data(driver) if baseline else scraper1.scrape_data_batched(driver)
+        seen, _, _ = scraper1.save_to_db(sink, listings)
+        rows.append(seen)
+        if page < site.pages and not pages.advance(page + 1):
+            break
+    return rows
+
+
+def run_scraper2(driver, site, sink, baseline, prefetch):
+    driver.get(f"{site.base_url}/quasar")
+    pages = prefetcher(driver, site, "/quasar", prefetch, (By.CLASS_NAME, 'q-ml-sm'), scraper2.go_to_next_page)
+    rows = []
+    for page in range(1, site.pages + 1):
+        metrics.set_page(page)
+        if page < site.pages:
+            pages.prefetch(page + 1)
+        listings = scraper2.scrape(driver) if baseline else scraper2.scrape_snapshot(driver)
+        seen, _, _ = scraper2.save_to_db(sink, listings)
+        rows.append(seen)
+        if page < site.pages and not pages.advance(page + 1):
+            break
+    return rows
+
+
+def run_scraper3(driver, site, sink, baseline, prefetch):
+    driver.get(f"{site.base_url}/offers")
+    scraper3.handle_cookie_popup(driver)
+    rows = []
+    for page in range(1, site.pages + 1):
+        metrics.set_page(page)
+        rows.append(scraper3.scrape_page(driver, page, sink) or 0)
+        if page < site.pages and not scraper3.click_next_page(driver):
+            break
+        scraper3.handle_cookie_popup(driver)
+    return rows
+
+
+def run_scraper4(driver, site, sink, baseline, prefetch):
+    driver.get(f"{site.base_url}/feedback")
+    pages = prefetcher(driver, site, "/feedback", prefetch, (By.XPATH, '//div[contains(@class, "feedback-item")]'),
+                       scraper4.go_to_next_page)
+    rows = []
+    for page in range(1, site.pages + 1):
+        metrics.set_page(page)
+        if page < site.pages:
+            pages.prefetch(page + 1)
+        seen, _, _ = scraper4.save_feedback(sink, scraper4.scrape_current_page(driver))
+        rows.append(seen)
+        if page < site.pages and not pages.advance(page + 1):
+            break
+    return rows
+
+
+# name -> (runner, table, sink columns)
+SCRAPERS = {
+    "scraper1": (run_scraper1, scraper1.TABLE_NAME, scraper1.COLUMNS),
+    "scraper2": (run_scraper2, scraper2.TABLE_NAME, scraper2.COLUMNS),
+    "scraper3": (run_scraper3, scraper3.TABLE_NAME, scraper3.COLUMNS),
+    "scraper4": (run_scraper4, scraper4.TABLE_NAME, scraper4.COLUMNS),
+}
+
+
+def run_scraper3_cdp(site, sink, prefetch, tabs):
+    """scraper3 through cdp_engine; returns (rows per page, DevTools commands sent)"""
+    import cdp_engine
+
+    template = f"{site.base_url}/offers?page={{page}}" if prefetch else None
+    scraper = cdp_engine.CdpScraper(sink, tabs, start_url=f"{site.base_url}/offers", page_url_template=template)
+    report = scraper.run(site.pages)
+    return [report[page] or 0 for page in sorted(report)], scraper.commands
+
+
+# name -> (module, record) for --engine api
+API_SCRAPERS = {
+    "scraper1": (scraper1, Listing),
+    "scraper2": (scraper2, SellerListing),
+}
+
+
+def run_listing_api(name, site, sink):
+    """scraper1/scraper2 through api_fetch; returns (rows per page, HTTP requests made)"""
+    module, record = API_SCRAPERS[name]
+    rows = []
+    with api_fetch.ListingApi(f"{site.base_url}/api/listings?page={{page}}", record, module.API_FIELDS) as api:
+        for page, records in api.pages(1, site.pages):
+            metrics.set_page(page)
+            seen, _, _ = module.save_to_db(sink, records)
+            rows.append(seen)
+    return rows, len(rows)
+
+
+def benchmark(name, site, baseline=False, profile="performance", prefetch=False, engine="selenium", tabs=1,
+              page_budget=None):
+    """Run one scraper against the fixture site and return its throughput figures"""
+    runner, table, columns = SCRAPERS[name]
+    conn = db.get_conn()
+    db.ensure_schema(conn, table, 'crawl_checkpoints')
+    copy_sink = TimedCopySink(conn, table, columns, conflict_column='row_hash')
+    sink = BackgroundWriter(copy_sink)
+
+    if engine == "cdp":
+        if name != "scraper3":
+            raise ValueError("--engine cdp is only implemented for scraper3")
+        try:
+            started = time.perf_counter()
+            rows, calls = run_scraper3_cdp(site, sink, prefetch, tabs)
+            sink.close()
+            elapsed = time.perf_counter() - started
+        finally:
+            db.put_conn(conn)
+        trace = {"over_budget": [], "call_sites": []}
+    elif engine == "api":
+        if name not in API_SCRAPERS:
+            raise ValueError("--engine api is only implemented for scraper1 and scraper2")
+        try:
+            started = time.perf_counter()
+            rows, calls = run_listing_api(name, site, sink)
+            sink.close()
+            elapsed = time.perf_counter() - started
+        finally:
+            db.put_conn(conn)
+        trace = {"over_budget": [], "call_sites": []}
+    else:
+        driver = driver_factory.create_driver(profile)
+        # Budget breaches are reported with the results rather than raised on quit
+        tracer = command_trace.trace(driver, page_budget, "warn")
+        try:
+            started = time.perf_counter()
+            rows = runner(driver, site, sink, baseline, prefetch)
+            sink.close()
+            elapsed = time.perf_counter() - started
+        finally:
+            driver.quit()
+            db.put_conn(conn)
+        trace = tracer.summary()
+        calls = trace["calls"]
+
+    pages = len(rows) or 1
+    busiest = trace["call_sites"][0] if trace["call_sites"] else None
+    return {
+        "scraper": name,
+        "mode": "baseline" if baseline else "default",
+        "engine": engine,
+        "browser_profile": profile,
+        "prefetch": prefetch,
+        "pages": len(rows),
+        "rows": sum(rows),
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(sum(rows) / elapsed, 1) if elapsed else 0.0,
+        "seconds_per_page": round(elapsed / pages, 3),
+        # DevTools messages for the cdp engine, HTTP requests for the api one
+        "webdriver_calls_per_page": round(calls / pages, 1),
+        "db_write_seconds": round(copy_sink.write_seconds, 3),
+        "busiest_call_site": f"{busiest['site']} {busiest['command']} x{busiest['calls']}" if busiest else "",
+        "pages_over_budget": len(trace["over_budget"]),
+    }
+
+
+def print_results(results):
+    columns = ["scraper", "mode", "engine", "browser_profile", "prefetch", "pages", "rows", "rows_per_second", "seconds_per_page",
+               "webdriver_calls_per_page", "db_write_seconds", "pages_over_budget", "busiest_call_site"]
+    print("\n" + " | ".join(columns))
+    for result in results:
+        print(" | ".join(str(result[column]) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against the local fixture site")
+    parser.add_argument("--scrapers", default="scraper1,scraper2,scraper3,scraper4")
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=20, help="rows per page")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fixture response")
+    parser.add_argument("--baseline", action="store_true", help="use the per-element extractors where they are kept")
+    parser.add_argument("--browser-profile", default="performance", choices=["performance", "default"],
+                        help="driver_factory profile; 'default' is a headed, unblocked Chrome")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="render the next page in a background tab while the current one is extracted")
+    parser.add_argument("--engine", choices=["selenium", "cdp", "api"], default="selenium",
+                        help="browser engine; cdp (DevTools over WebSocket) is implemented for scraper3, "
+                             "api (the listing JSON, no browser) for scraper1 and scraper2")
+    parser.add_argument("--tabs", type=int, default=1, help="concurrent tabs for --engine cdp")
+    parser.add_argument("--page-budget", type=int, default=command_trace.PAGE_BUDGET,
+                        help="most WebDriver round trips a page may take; pages over it are reported")
+    parser.add_argument("--fail-over-budget", action="store_true",
+                        help="exit non-zero if any page went over --page-budget (for CI)")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    # A fresh run id keeps the dedup layer from discarding this run's rows
+    with FixtureSite(args.pages, args.rows, args.latency, run_id=uuid.uuid4().hex[:8]) as site:
+        try:
+            for name in args.scrapers.split(","):
+                results.append(benchmark(name.strip(), site, args.baseline, args.browser_profile, args.prefetch,
+                                         args.engine, args.tabs, args.page_budget))
+        finally:
+            db.close_pool()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.fail_over_budget and any(result["pages_over_budget"] for result in results):
+        sys.exit(f"Pages went over the budget of {args.page_budget} WebDriver round trips")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
+from selenium.webdriver.remote.webdriver import WebDriver as RemoteWebDriver
+import driver_factory
+import logs
+
+log = logs.get_logger("browser_daemon")
+
+# Clear of chromedriver's own default (9515), which the warm sessions' services may take
+DEFAULT_PORT = 9615
+
+# Marks a session whose release is in progress, so a second release of the same lease fails
+_RETURNING = object()
+
+
+def process_tree_rss(root_pid):
+    """Resident memory in bytes of root_pid and all its descendants; 0 where /proc is unavailable"""
+    if not os.path.isdir("/proc"):
+        return 0
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, so split after its closing paren
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except OSError:
+            pass
+        stack.extend(children.get(pid, []))
+    return total
+
+
+class WarmSession:
+    """One chromedriver process with a live Chrome session, reachable as a Remote WebDriver endpoint"""
+
+    def __init__(self, profile, warm_url=None):
+        self.service = Service()
+        self.driver = webdriver.Chrome(service=self.service, options=driver_factory.chrome_options(profile))
+        if profile == "performance":
+            driver_factory.block_heavy_resources(self.driver)
+        if warm_url:
+            self.driver.get(warm_url)
+        self.pages = 0
+        self.lease_id = None
+        # When the lease holder last leased or renewed the session
+        self.renewed_at = None
+        self.started_at = time.time()
+
+    @property
+    def executor(self):
+        return self.service.service_url
+
+    @property
+    def session_id(self):
+        return self.driver.session_id
+
+    def rss(self):
+        return process_tree_rss(self.service.process.pid)
+
+    def healthy(self):
+        try:
+            self.driver.window_handles
+            return True
+        except Exception:
+            return False
+
+    def reset(self, warm_url=None):
+        """Close extra tabs and park the remaining one, keeping cookies and cache warm"""
+        handles = self.driver.window_handles
+        for handle in handles[1:]:
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+        self.driver.switch_to.window(handles[0])
+        self.driver.get(warm_url or "about:blank")
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            log.warning("Error quitting browser session: %s", e)
+
+
+class BrowserPool:
+    """Keep `size` warm sessions, lease them out and recycle worn ones
+
+    A session is replaced when it is returned after max_pages page loads in
+    total, when its browser process tree is above max_rss_mb, or when it no
+    longer answers. A lease neither renewed nor returned within lease_ttl
+    seconds (its client crashed, say) is reclaimed as if it had been released;
+    AttachedDriver renews its lease as it loads pages, so only silent leases
+    expire.
+    """
+
+    def __init__(self, size=2, profile="performance", max_pages=200, max_rss_mb=1500, warm_url=None,
+                 lease_ttl=600.0):
+        self.profile = profile
+        self.max_pages = max_pages
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.warm_url = warm_url
+        self.lease_ttl = lease_ttl
+        self.condition = threading.Condition()
+        self.sessions = [WarmSession(profile, warm_url) for _ in range(size)]
+
+    def lease(self, timeout=30.0):
+        """Return a free session, waiting up to timeout seconds; None if none frees up"""
+        deadline = time.monotonic() + timeout
+        while True:
+            self.reclaim_expired()
+            with self.condition:
+                for session in self.sessions:
+                    if session.lease_id is None:
+                        session.lease_id = uuid.uuid4().hex
+                        session.renewed_at = time.monotonic()
+                        return session
+                now = time.monotonic()
+                if now >= deadline:
+                    return None
+                # Wake up in time to reclaim the next lease that expires
+                expiries = [s.renewed_at + self.lease_ttl for s in self.sessions
+                            if self.lease_ttl and isinstance(s.lease_id, str)]
+                self.condition.wait(min([deadline] + expiries) - now)
+
+    def renew(self, lease_id):
+        """Restart lease_id's TTL; False if it is not an active lease (reclaimed or released already)"""
+        if not lease_id:
+            return False
+        with self.condition:
+            session = next((s for s in self.sessions if s.lease_id == lease_id), None)
+            if session is None:
+                return False
+            session.renewed_at = time.monotonic()
+            self.condition.notify()
+            return True
+
+    def reclaim_expired(self):
+        """Release the leases not renewed within lease_ttl"""
+        if not self.lease_ttl:
+            return
+        now = time.monotonic()
+        with self.condition:
+            expired = [s.lease_id for s in self.sessions
+                       if isinstance(s.lease_id, str) and now - s.renewed_at >= self.lease_ttl]
+        for lease_id in expired:
+            log.warning("Lease %s not renewed within %ss, reclaiming its browser session", lease_id, self.lease_ttl)
+            self.release(lease_id)
+
+    def release(self, lease_id, pages=0):
+        if not lease_id:
+            return False
+        with self.condition:
+            session = next((s for s in self.sessions if s.lease_id == lease_id), None)
+            if session is None:
+                return False
+            session.lease_id = _RETURNING
+            session.pages += pages
+
+        # Recycle or reset outside the lock; the session stays leased meanwhile
+        if not session.healthy() or session.pages >= self.max_pages or (self.max_rss and session.rss() > self.max_rss):
+            log.info("Recycling browser session after %s pages", session.pages)
+            session.quit()
+            try:
+                replacement = WarmSession(self.profile, self.warm_url)
+            except Exception as e:
+                log.error("Could not start a replacement browser session, pool shrinks to %s: %s",
+                          len(self.sessions) - 1, e)
+                with self.condition:
+                    self.sessions.remove(session)
+                    self.condition.notify()
+                return True
+            with self.condition:
+                self.sessions[self.sessions.index(session)] = replacement
+                self.condition.notify()
+            return True
+
+        try:
+            session.reset(self.warm_url)
+        except Exception as e:
+            log.warning("Error resetting browser session: %s", e)
+        with self.condition:
+            session.lease_id = None
+            session.renewed_at = None
+            self.condition.notify()
+        return True
+
+    def status(self):
+        with self.condition:
+            return [
+                {
+                    "session_id": s.session_id,
+                    "executor": s.executor,
+                    "leased": s.lease_id is not None,
+                    "pages": s.pages,
+                    "rss_mb": round(s.rss() / 1024 / 1024, 1),
+                    "age_seconds": round(time.time() - s.started_at),
+                }
+                for s in self.sessions
+            ]
+
+    def close(self):
+        with self.condition:
+            for session in self.sessions:
+                session.quit()
+            self.sessions = []
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/status":
+            self.send_json({"sessions": self.server.pool.status()})
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if url.path == "/lease":
+            timeout = float(parse_qs(url.query).get("timeout", ["30"])[0])
+            session = self.server.pool.lease(timeout)
+            if session is None:
+                self.send_json({"error": "no free browser session"}, 503)
+                return
+            self.send_json({
+                "lease_id": session.lease_id,
+                "executor": session.executor,
+                "session_id": session.session_id,
+                "capabilities": session.driver.caps,
+                "lease_ttl": self.server.pool.lease_ttl,
+            })
+        elif url.path == "/renew":
+            renewed = self.server.pool.renew(body.get("lease_id"))
+            self.send_json({"renewed": renewed}, 200 if renewed else 404)
+        elif url.path == "/release":
+            released = self.server.pool.release(body.get("lease_id"), int(body.get("pages", 0)))
+            self.send_json({"released": released}, 200 if released else 404)
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+
+class AttachedDriver(RemoteWebDriver):
+    """Remote WebDriver bound to a leased daemon session; quit() hands the session back
+
+    Page loads renew the lease once a third of the daemon's lease TTL has
+    passed since the last renewal, so a long crawl keeps its session.
+    """
+
+    def __init__(self, daemon_url, lease):
+        self.daemon_url = daemon_url
+        self.lease = lease
+        self.pages = 0
+        self.renewed_at = time.monotonic()
+        executor = ChromiumRemoteConnection(lease["executor"], vendor_prefix="goog", browser_name="chrome")
+        super().__init__(command_executor=executor, options=webdriver.ChromeOptions())
+
+    def start_session(self, capabilities):
+        # Attach to the daemon's live session instead of creating a new one
+        self.session_id = self.lease["session_id"]
+        self.caps = self.lease.get("capabilities") or {}
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        return self.execute("executeCdpCommand", {"cmd": cmd, "params": cmd_args})["value"]
+
+    def get(self, url):
+        super().get(url)
+        self.note_page()
+
+    def note_page(self):
+        """Count a page load toward the session's recycle budget and keep the lease alive"""
+        self.pages += 1
+        ttl = self.lease.get("lease_ttl") if self.lease else None
+        if ttl and time.monotonic() - self.renewed_at >= ttl / 3:
+            self.renew()
+
+    def renew(self):
+        """Restart the lease's TTL on the daemon"""
+        self.renewed_at = time.monotonic()
+        try:
+            post_json(f"{self.daemon_url}/renew", {"lease_id": self.lease["lease_id"]})
+        except HTTPError as e:
+            # 404: the lease expired before this renewal and the session may be someone else's now
+            log.warning("Could not renew browser session %s: %s", self.session_id, e)
+
+    def quit(self):
+        if self.lease is None:
+            return
+        try:
+            post_json(f"{self.daemon_url}/release", {"lease_id": self.lease["lease_id"], "pages": self.pages})
+        except HTTPError as e:
+            # 404: the lease outlived the daemon's lease TTL and was reclaimed already
+            log.warning("Could not release browser session %s: %s", self.session_id, e)
+        finally:
+            self.lease = None
+
+
+def post_json(url, payload, timeout=60):
+    request = Request(url, data=json.dumps(payload).encode("utf-8"),
+                      headers={"Content-Type": "application/json"}, method="POST")
+    with urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def lease_driver(daemon_url, timeout=30):
+    """Lease a warm session from the daemon at daemon_url as a WebDriver"""
+    lease = post_json(f"{daemon_url}/lease?timeout={timeout}", {}, timeout=timeout + 30)
+    log.debug("Leased browser session %s", lease["session_id"])
+    return AttachedDriver(daemon_url, lease)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep warm Chrome sessions for the scrapers to lease")
+    parser.add_argument("--size", type=int, default=2, help="number of warm browser sessions")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--profile", default=driver_factory.BROWSER_PROFILE, choices=["performance", "default"])
+    parser.add_argument("--max-pages", type=int, default=200, help="recycle a session after this many page loads")
+    parser.add_argument("--max-rss-mb", type=int, default=1500, help="recycle a session above this resident memory")
+    parser.add_argument("--warm-url", help="page to keep loaded in idle sessions")
+    parser.add_argument("--lease-ttl", type=float, default=600.0,
+                        help="seconds without a renewal before a lease is reclaimed; 0 to never reclaim")
+    args = parser.parse_args()
+
+    pool = BrowserPool(args.size, args.profile, args.max_pages, args.max_rss_mb, args.warm_url, args.lease_ttl)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), DaemonHandler)
+    server.pool = pool
+    log.info("Browser daemon serving %s sessions on http://127.0.0.1:%s", args.size, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import io
+import threading
+import time
+import psycopg2
+from psycopg2 import sql
+import checkpoints
+import logs
+import metrics
+
+log = logs.get_logger("bulk_sink")
+
+
+def csv_field(value):
+    """Quote a value for COPY ... CSV; None stays unquoted so it loads as NULL"""
+    if value is None:
+        return ''
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class CopySink:
+    """Buffer rows and write them to one table with COPY ... FROM STDIN
+
+    Rows are flushed once max_rows are buffered or the oldest buffered row is
+    older than max_age seconds, each flush in its own transaction. The sink
+    is safe to share between threads.
+
+    With conflict_column set, rows are copied into a temporary staging table
+    and moved across with INSERT ... ON CONFLICT (conflict_column) DO NOTHING,
+    since COPY itself cannot skip duplicates.
+
+    Checkpoints recorded with checkpoint() are written in the same transaction
+    as the rows buffered before them, so a checkpoint never gets ahead of the
+    data it describes. A failed flush is rolled back and its error re-raised,
+    so the BackgroundWriter in front of the sink reports it to the scraper.
+    Each flush that writes anything is timed as the db_flush phase.
+    """
+
+    def __init__(self, conn, table, columns, max_rows=1000, max_age=5.0, conflict_column=None):
+        self.conn = conn
+        self.table = table
+        self.columns = list(columns)
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.rows = []
+        self.checkpoints = {}
+        self.first_row_at = None
+        self.lock = threading.RLock()
+        self.conflict_column = conflict_column
+
+        column_list = sql.SQL(', ').join(map(sql.Identifier, self.columns))
+        copy_target = sql.Identifier(f"{table}_stage" if conflict_column else table)
+        self.copy_sql = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(copy_target, column_list)
+        if conflict_column:
+            self.stage_sql = sql.SQL(
+                "CREATE TEMP TABLE IF NOT EXISTS {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+            ).format(copy_target, sql.Identifier(table))
+            self.merge_sql = sql.SQL(
+                "INSERT INTO {table} ({columns}) SELECT {columns} FROM {stage} ON CONFLICT ({key}) DO NOTHING"
+            ).format(
+                table=sql.Identifier(table),
+                columns=column_list,
+                stage=copy_target,
+                key=sql.Identifier(conflict_column)
+            )
+
+    def add(self, row):
+        self.add_many([row])
+
+    def _pending(self):
+        return bool(self.rows or self.checkpoints)
+
+    def add_many(self, rows):
+        with self.lock:
+            if not self._pending():
+                self.first_row_at = time.monotonic()
+            self.rows.extend(rows)
+            if len(self.rows) >= self.max_rows:
+                self.flush()
+            else:
+                self.flush_if_due()
+
+    def checkpoint(self, scraper, target_url, page, row_index):
+        """Mark page as complete once everything buffered so far is committed; page None clears the checkpoint"""
+        with self.lock:
+            if not self._pending():
+                self.first_row_at = time.monotonic()
+            self.checkpoints[(scraper, target_url)] = (page, row_index)
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """Flush if the oldest buffered row has waited longer than max_age"""
+        with self.lock:
+            if self._pending() and time.monotonic() - self.first_row_at >= self.max_age:
+                return self.flush()
+            return 0
+
+    def write_rows(self, cursor, buffer, count):
+        """Load count rows of CSV from buffer inside the flush transaction, returning how many were inserted"""
+        if self.conflict_column:
+            cursor.execute(self.stage_sql)
+            cursor.copy_expert(self.copy_sql, buffer)
+            cursor.execute(self.merge_sql)
+            return cursor.rowcount
+        cursor.copy_expert(self.copy_sql, buffer)
+        return count
+
+    def flush(self):
+        """Write buffered rows in a single COPY transaction, returning the inserted row count"""
+        with self.lock:
+            rows, self.rows = self.rows, []
+            pending_checkpoints, self.checkpoints = self.checkpoints, {}
+            if not rows and not pending_checkpoints:
+                return 0
+            return self.commit(rows, pending_checkpoints)
+
+    @metrics.timed("db_flush")
+    def commit(self, rows, pending_checkpoints):
+        """Write rows and checkpoints in one transaction, returning the inserted row count"""
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write(','.join(csv_field(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+
+        try:
+            with self.conn.cursor() as cursor:
+                inserted = self.write_rows(cursor, buffer, len(rows)) if rows else 0
+                for (scraper, target_url), (page, row_index) in pending_checkpoints.items():
+                    checkpoints.write(cursor, scraper, target_url, page, row_index)
+            self.conn.commit()
+            return inserted
+        except psycopg2.Error as e:
+            log.error("Error copying %s rows into %s: %s", len(rows), self.table, e)
+            self.conn.rollback()
+            raise
+
+    def close(self):
+        return self.flush()
@@ -0,0 +1,482 @@
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import urllib.request
+from contextlib import asynccontextmanager
+import checkpoints
+import driver_factory
+import logs
+import metrics
+import scraper3
+from db_writer import WriterError
+from records import Offer
+
+log = logs.get_logger("cdp_engine")
+
+# Chrome to launch when no --cdp-url is given; otherwise the first of CHROME_NAMES on PATH
+CHROME_BINARY = os.environ.get("SCRAPER_CHROME_BINARY")
+CHROME_NAMES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+
+# Seconds without a request in flight after which a tab's network counts as idle
+NETWORK_IDLE = 0.5
+
+# All three lists in one Runtime.evaluate, zipped like scraper3.parse_page_source
+EXTRACT_SCRIPT = """
+((selectors) => {
+    const texts = selectors.map(selector => Array.from(document.querySelectorAll(selector), el => el.innerText.trim()));
+    const count = Math.min(...texts.map(values => values.length));
+    const out = [];
+    for (let i = 0; i < count; i++) {
+        out.push(texts.map(values => values[i]));
+    }
+    return out;
+})(%s)
+""" % json.dumps([scraper3.GAME_SELECTOR.css, scraper3.SERVER_SELECTOR.css, scraper3.PRICE_SELECTOR.css])
+
+# Resolves once selector matches (true) or timeout ms pass (false); the page does the waiting, not us
+WAIT_FOR_SCRIPT = """
+((selector, timeout) => new Promise(resolve => {
+    if (document.querySelector(selector)) {
+        resolve(true);
+        return;
+    }
+    const observer = new MutationObserver(() => {
+        if (document.querySelector(selector)) {
+            observer.disconnect();
+            clearTimeout(timer);
+            resolve(true);
+        }
+    });
+    observer.observe(document.documentElement, {childList: true, subtree: true});
+    const timer = setTimeout(() => {
+        observer.disconnect();
+        resolve(false);
+    }, timeout);
+}))(%s, %s)
+"""
+
+CONSENT_SCRIPT = """
+(() => {
+    const popup = document.getElementById('isEurope');
+    if (!popup || getComputedStyle(popup).display === 'none') {
+        return false;
+    }
+    const button = popup.querySelector('#acceptCookiesButton');
+    if (button) {
+        button.click();
+    }
+    return true;
+})()
+"""
+
+NEXT_SCRIPT = """
+((selector) => {
+    const next = document.querySelector(selector);
+    if (!next) {
+        return false;
+    }
+    next.scrollIntoView({block: 'center'});
+    next.click();
+    return true;
+})(%s)
+""" % json.dumps(scraper3.NEXT_PAGE_SELECTOR)
+
+
+class CdpError(Exception):
+    """A DevTools command failed, or the page threw while evaluating a script"""
+
+
+class CdpConnection:
+    """One DevTools WebSocket, multiplexing the flattened sessions of every attached tab
+
+    Commands are matched to their responses by id, so any number can be in
+    flight from one event loop; events are handed to the tab owning their
+    sessionId. commands counts every command sent, for benchmarking.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.ids = itertools.count(1)
+        self.pending = {}
+        self.handlers = {}
+        self.commands = 0
+        self.reader = asyncio.get_running_loop().create_task(self._read())
+
+    @classmethod
+    async def connect(cls, url):
+        import websockets
+
+        return cls(await websockets.connect(url, max_size=None))
+
+    async def send(self, method, params=None, session_id=None):
+        message_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[message_id] = future
+        message = {"id": message_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        self.commands += 1
+        await self.websocket.send(json.dumps(message))
+        return await future
+
+    async def _read(self):
+        error = None
+        try:
+            async for raw in self.websocket:
+                message = json.loads(raw)
+                if "id" in message:
+                    future = self.pending.pop(message["id"], None)
+                    if future is None or future.done():
+                        continue
+                    if "error" in message:
+                        future.set_exception(CdpError(message["error"].get("message", message["error"])))
+                    else:
+                        future.set_result(message.get("result", {}))
+                else:
+                    handler = self.handlers.get(message.get("sessionId"))
+                    if handler:
+                        handler(message["method"], message.get("params", {}))
+        except Exception as e:
+            error = e
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(CdpError(f"DevTools connection closed: {error}"))
+            self.pending.clear()
+
+    async def close(self):
+        await self.websocket.close()
+        await self.reader
+
+
+class CdpTab:
+    """A page target driven over a CdpConnection session
+
+    Tracks its own in-flight requests from Network events, so waits for
+    load or network idle are driven by what the browser reports instead of
+    polling the DOM over the wire.
+    """
+
+    def __init__(self, connection, target_id, session_id):
+        self.connection = connection
+        self.target_id = target_id
+        self.session_id = session_id
+        self.waiters = {}
+        self.in_flight = set()
+        self.network_at = time.monotonic()
+        connection.handlers[session_id] = self.dispatch
+
+    @classmethod
+    async def open(cls, connection):
+        target = await connection.send("Target.createTarget", {"url": "about:blank"})
+        attached = await connection.send("Target.attachToTarget", {"targetId": target["targetId"], "flatten": True})
+        tab = cls(connection, target["targetId"], attached["sessionId"])
+        await tab.send("Page.enable")
+        await tab.send("Network.enable")
+        if driver_factory.BROWSER_PROFILE == "performance":
+            await tab.send("Network.setBlockedURLs", {"urls": driver_factory.BLOCKED_URL_PATTERNS})
+        return tab
+
+    def send(self, method, params=None):
+        return self.connection.send(method, params, self.session_id)
+
+    def dispatch(self, method, params):
+        if method == "Network.requestWillBeSent":
+            self.in_flight.add(params["requestId"])
+            self.network_at = time.monotonic()
+        elif method in ("Network.loadingFinished", "Network.loadingFailed"):
+            self.in_flight.discard(params["requestId"])
+            self.network_at = time.monotonic()
+        for future in self.waiters.pop(method, []):
+            if not future.done():
+                future.set_result(params)
+
+    def expect(self, method):
+        """Future for the next method event; create it before the command that triggers it"""
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(method, []).append(future)
+        return future
+
+    async def network_idle(self, quiet=NETWORK_IDLE):
+        """Return once no request has been in flight for quiet seconds"""
+        while True:
+            remaining = quiet - (time.monotonic() - self.network_at)
+            if not self.in_flight and remaining <= 0:
+                return
+            await asyncio.sleep(max(remaining, quiet / 5))
+
+    async def evaluate(self, expression, await_promise=False):
+        result = await self.send("Runtime.evaluate", {
+            "expression": expression,
+            "returnByValue": True,
+            "awaitPromise": await_promise,
+        })
+        if "exceptionDetails" in result:
+            raise CdpError(result["exceptionDetails"].get("text", "script failed"))
+        return result["result"].get("value")
+
+    async def navigate(self, url, timeout):
+        """Load url and wait for its load event, returning how long that took"""
+        started = time.perf_counter()
+        loaded = self.expect("Page.loadEventFired")
+        result = await self.send("Page.navigate", {"url": url})
+        if result.get("errorText"):
+            loaded.cancel()
+            raise CdpError(f"Navigation to {url} failed: {result['errorText']}")
+        await asyncio.wait_for(loaded, timeout)
+        return time.perf_counter() - started
+
+    async def click_next(self, timeout):
+        """Click the Next link and wait for the load event or, for client-side renders, network idle"""
+        started = time.perf_counter()
+        loaded = self.expect("Page.loadEventFired")
+        self.network_at = time.monotonic()
+        if not await self.evaluate(NEXT_SCRIPT):
+            loaded.cancel()
+            return None
+        idle = asyncio.ensure_future(self.network_idle())
+        done, _ = await asyncio.wait({loaded, idle}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        loaded.cancel()
+        idle.cancel()
+        if not done:
+            raise asyncio.TimeoutError()
+        return time.perf_counter() - started
+
+    async def wait_for(self, selector, timeout):
+        """True once selector matches in the page, False after timeout seconds"""
+        script = WAIT_FOR_SCRIPT % (json.dumps(selector), int(timeout * 1000))
+        return await asyncio.wait_for(self.evaluate(script, await_promise=True), timeout + 1)
+
+    async def close(self):
+        self.connection.handlers.pop(self.session_id, None)
+        try:
+            await self.connection.send("Target.closeTarget", {"targetId": self.target_id})
+        except CdpError as e:
+            log.warning("Error closing tab: %s", e)
+
+
+def chrome_binary():
+    if CHROME_BINARY:
+        return CHROME_BINARY
+    for name in CHROME_NAMES:
+        path = shutil.which(name)
+        if path:
+            return path
+    raise CdpError(f"No Chrome found; set SCRAPER_CHROME_BINARY (looked for {', '.join(CHROME_NAMES)})")
+
+
+async def launch_chrome(user_data_dir, timeout=30):
+    """Start Chrome with a DevTools port of its choosing, returning (process, browser WebSocket URL)"""
+    args = [chrome_binary(), "--remote-debugging-port=0", f"--user-data-dir={user_data_dir}"]
+    if driver_factory.BROWSER_PROFILE == "performance":
+        args += driver_factory.PERFORMANCE_ARGS
+
+    # Chrome writes the port it picked, then the browser target's path, once it is listening;
+    # a persistent profile may still hold the file of an earlier run, pointing at a dead port
+    port_file = os.path.join(user_data_dir, "DevToolsActivePort")
+    try:
+        os.remove(port_file)
+    except FileNotFoundError:
+        pass
+    process = subprocess.Popen(args + ["about:blank"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CdpError(f"Chrome exited with status {process.returncode}")
+        try:
+            with open(port_file) as f:
+                port, path = f.read().split()[:2]
+            return process, f"ws://127.0.0.1:{port}{path}"
+        except (OSError, ValueError):
+            await asyncio.sleep(0.05)
+    process.kill()
+    raise CdpError(f"Chrome did not open a DevTools port within {timeout}s")
+
+
+def browser_websocket_url(url):
+    """Accept a ws:// browser URL as-is, or look it up from an http://host:port DevTools endpoint"""
+    if url.startswith("ws"):
+        return url
+    with urllib.request.urlopen(f"{url.rstrip('/')}/json/version", timeout=10) as response:
+        return json.load(response)["webSocketDebuggerUrl"]
+
+
+@asynccontextmanager
+async def page_load_slot(pacer):
+    """pacer.slot() for coroutines; the blocking acquire runs off the event loop"""
+    slot = pacer.slot()
+    await asyncio.to_thread(slot.__enter__)
+    try:
+        yield
+    finally:
+        slot.__exit__(None, None, None)
+
+
+class CdpScraper:
+    """scraper3 over the DevTools protocol: tabs page ranges concurrently from one event loop
+
+    Same page sharding, checkpoints, pacing and sink as the Selenium path;
+    only the browser calls differ. Each page costs a handful of WebSocket
+    messages instead of a chromedriver HTTP round trip per element.
+    """
+
+    def __init__(self, sink, tabs=1, check_stored=True, incremental=False, resume=False, archive=None,
+                 browser_url=None, profile_dir=None, start_url=None, page_url_template=None):
+        self.sink = sink
+        self.tabs = max(1, tabs)
+        self.check_stored = check_stored
+        self.incremental = incremental
+        self.resume = resume
+        self.archive = archive
+        self.browser_url = browser_url
+        self.profile_dir = profile_dir
+        self.start_url = start_url or scraper3.START_URL
+        self.page_url_template = page_url_template or scraper3.PAGE_URL_TEMPLATE
+        self.pacer = scraper3.pacer
+        self.commands = 0
+
+    def run(self, max_pages):
+        """Scrape pages 1..max_pages, returning {page: new offers queued, or None if it failed}"""
+        return asyncio.run(self.scrape(max_pages))
+
+    async def scrape(self, max_pages):
+        process = None
+        user_data_dir = None
+        if self.browser_url:
+            url = browser_websocket_url(self.browser_url)
+        else:
+            user_data_dir = self.profile_dir or tempfile.mkdtemp(prefix="cdp-engine-")
+            process, url = await launch_chrome(user_data_dir)
+
+        connection = await CdpConnection.connect(url)
+        report = {}
+        try:
+            if scraper3.CONSENT_COOKIE:
+                await connection.send("Storage.setCookies", {"cookies": [scraper3.CONSENT_COOKIE]})
+            ranges = scraper3.shard_pages(max_pages, self.tabs)
+            self.pacer.max_concurrency = max(self.pacer.max_concurrency, len(ranges))
+            results = await asyncio.gather(*(
+                self.scrape_range(connection, first_page, last_page) for first_page, last_page in ranges
+            ))
+            for result in results:
+                report.update(result)
+        finally:
+            self.commands = connection.commands
+            await connection.close()
+            if process:
+                process.terminate()
+                process.wait()
+                if not self.profile_dir:
+                    shutil.rmtree(user_data_dir, ignore_errors=True)
+        return report
+
+    async def open_page(self, tab, page_num):
+        if self.page_url_template:
+            self.pacer.observe(await tab.navigate(self.page_url_template.format(page=page_num), self.pacer.timeout))
+            return True
+        self.pacer.observe(await tab.navigate(self.start_url, self.pacer.timeout))
+        for _ in range(page_num - 1):
+            if not await self.next_page(tab):
+                return False
+        return True
+
+    @metrics.timed("click_next_page")
+    async def next_page(self, tab):
+        """False when there is no Next link; a click that never loads raises NavigationError"""
+        try:
+            elapsed = await tab.click_next(self.pacer.timeout)
+        except asyncio.TimeoutError as e:
+            self.pacer.failure("timeout")
+            raise checkpoints.NavigationError("next page did not load") from e
+        if elapsed is None:
+            return False
+        self.pacer.observe(elapsed)
+        return True
+
+    @metrics.timed("scrape_page")
+    async def scrape_page(self, tab, page_num, checkpoint_key=None):
+        """Extract the current page in-page and stream it to the sink, returning the new offer count"""
+        log.info("Page %s", page_num, extra={"page": page_num})
+        try:
+            if not await tab.wait_for(scraper3.GAME_SELECTOR.css, self.pacer.timeout):
+                self.pacer.failure("timeout")
+                raise CdpError("no offers rendered")
+            if await tab.evaluate(CONSENT_SCRIPT):
+                log.info("Cookie popup closed")
+            if self.archive:
+                html = await tab.evaluate("document.documentElement.outerHTML")
+                self.archive.record(page_num, await tab.evaluate("location.href"), html)
+            offers = [Offer(*values) for values in await tab.evaluate(EXTRACT_SCRIPT)]
+            # db.new_rows may query Postgres, so the save runs off the event loop
+            seen, new_count, last = await asyncio.to_thread(scraper3.save_offers, self.sink, offers, self.check_stored)
+        except WriterError:
+            raise
+        except Exception as e:
+            log.error("Error scraping page %s: %s", page_num, e)
+            return None
+
+        log.info("Queued %s new of %s records from page %s (last %s)", new_count, seen, page_num,
+                 last.game_name if last else None, extra={"page": page_num, "rows": seen, "new_rows": new_count})
+        if checkpoint_key:
+            # The writer queue may be full; block a thread, not every tab
+            await asyncio.to_thread(self.sink.checkpoint, checkpoint_key, scraper3.START_URL, page_num, seen)
+        return new_count
+
+    async def scrape_range(self, connection, first_page, last_page):
+        """scraper3.scrape_page_range on a tab of the shared browser"""
+        report = {}
+        checkpoint_key = f"scraper3:{first_page}-{last_page}"
+        tab = None
+        try:
+            if self.resume:
+                checkpoint = await asyncio.to_thread(checkpoints.load, checkpoint_key, scraper3.START_URL)
+                if checkpoint:
+                    log.info("Resuming pages %s-%s after page %s", first_page, last_page, checkpoint[0])
+                    first_page = checkpoint[0] + 1
+                if first_page > last_page:
+                    await asyncio.to_thread(checkpoints.finish, self.sink, checkpoint_key, scraper3.START_URL)
+                    return report
+
+            tab = await CdpTab.open(connection)
+            async with page_load_slot(self.pacer):
+                opened = await self.open_page(tab, first_page)
+            if not opened:
+                log.error("Could not reach page %s", first_page)
+                return report
+
+            page_num = first_page
+            while page_num <= last_page:
+                # Each range runs as its own task, so this only labels this tab's metrics
+                metrics.set_page(page_num)
+                report[page_num] = await self.scrape_page(tab, page_num, checkpoint_key)
+                if report[page_num] is None:
+                    log.error("Stopping pages %s-%s at page %s, keeping the checkpoint", first_page, last_page, page_num)
+                    return report
+
+                if self.incremental and report[page_num] == 0:
+                    log.info("Only already-stored offers on page %s, stopping.", page_num)
+                    break
+
+                if page_num == last_page:
+                    break
+                async with page_load_slot(self.pacer):
+                    advanced = await self.next_page(tab)
+                if not advanced:
+                    log.info("No more pages available")
+                    break
+
+                page_num += 1
+
+            await asyncio.to_thread(checkpoints.finish, self.sink, checkpoint_key, scraper3.START_URL)
+        except Exception as e:
+            log.error("Error in pages %s-%s: %s", first_page, last_page, e)
+        finally:
+            if tab:
+                await tab.close()
+        return report
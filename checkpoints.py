@@ -0,0 +1,83 @@
+import psycopg2
+import db
+import logs
+
+log = logs.get_logger("checkpoints")
+
+# One row per (scraper, target_url): the last page whose rows are committed
+db.register_table("crawl_checkpoints", """
+    CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+        scraper TEXT NOT NULL,
+        target_url TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        row_index INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (scraper, target_url)
+    )
+""")
+
+class NavigationError(Exception):
+    """A page change or read failed (a dead browser, a timeout after the click), as opposed
+    to the listing having no next page: the run stops and keeps its checkpoint"""
+
+
+UPSERT_SQL = """
+    INSERT INTO crawl_checkpoints (scraper, target_url, page, row_index, updated_at)
+    VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (scraper, target_url) DO UPDATE
+    SET page = EXCLUDED.page, row_index = EXCLUDED.row_index, updated_at = EXCLUDED.updated_at
+"""
+
+DELETE_SQL = "DELETE FROM crawl_checkpoints WHERE scraper = %s AND target_url = %s"
+
+
+def write(cursor, scraper, target_url, page, row_index):
+    """Record a checkpoint inside the caller's transaction; page None clears it"""
+    if page is None:
+        cursor.execute(DELETE_SQL, (scraper, target_url))
+        return
+    cursor.execute(UPSERT_SQL, (scraper, target_url, page, row_index))
+
+
+def finish(sink, scraper, target_url):
+    """Clear the checkpoint behind the run's last rows once the listing is done, so --resume starts over"""
+    sink.checkpoint(scraper, target_url, None, None)
+
+
+def load(scraper, target_url):
+    """Return (page, row_index) of the last committed page, or None"""
+    with db.connection() as conn:
+        db.ensure_schema(conn, "crawl_checkpoints")
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT page, row_index FROM crawl_checkpoints WHERE scraper = %s AND target_url = %s",
+                    (scraper, target_url)
+                )
+                return cursor.fetchone()
+        except psycopg2.Error as e:
+            log.error("Error loading checkpoint: %s", e)
+            return None
+        finally:
+            conn.rollback()
+
+
+def fast_forward(driver, scraper, target_url, go_to_next_page):
+    """Click past the last checkpointed page, returning the page number to scrape next or None"""
+    checkpoint = load(scraper, target_url)
+    if not checkpoint:
+        return 1
+
+    page, row_index = checkpoint
+    log.info("Resuming %s after page %s (%s rows)", scraper, page, row_index)
+    if not skip_pages(driver, page, go_to_next_page):
+        return None
+    return page + 1
+
+
+def skip_pages(driver, pages, go_to_next_page):
+    """Click through the next `pages` pages, returning False if navigation failed"""
+    for _ in range(pages):
+        if not go_to_next_page(driver):
+            return False
+    return True
@@ -0,0 +1,171 @@
+import os
+import sys
+import threading
+import time
+import selenium
+import logs
+import metrics
+
+log = logs.get_logger("command_trace")
+
+# SCRAPER_TRACE_COMMANDS=1 makes driver_factory trace every driver it creates
+TRACE_COMMANDS = os.environ.get("SCRAPER_TRACE_COMMANDS", "") not in ("", "0")
+# Most WebDriver round trips one page may take (unset: no budget)
+PAGE_BUDGET = int(os.environ["SCRAPER_PAGE_BUDGET"]) if os.environ.get("SCRAPER_PAGE_BUDGET") else None
+# "warn" logs pages over budget; "fail" also makes check_all() raise BudgetExceeded at the end of the run
+BUDGET_ACTION = os.environ.get("SCRAPER_BUDGET_ACTION", "warn")
+
+# Call sites listed in each page summary
+TOP_CALL_SITES = 3
+
+# Frames in these files are never the call site
+_SKIP_FILES = (os.path.dirname(selenium.__file__), os.path.abspath(__file__))
+
+# (budget, [(page, calls)]) of every driver that quit over budget with the "fail" action
+_failures = []
+_failures_lock = threading.Lock()
+
+
+class BudgetExceeded(Exception):
+    """Raised by check_all, with the "fail" action, when pages went over their WebDriver round-trip budget"""
+
+
+def call_site():
+    """file:line function of the innermost caller outside selenium and this module"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith(_SKIP_FILES):
+            return f"{os.path.basename(filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return "?"
+
+
+class CommandTracer:
+    """Count and time every WebDriver command a driver sends, by command and call site
+
+    Wraps driver.execute, which elements also go through, so nothing in the
+    scrapers changes. Commands are attributed to the page set with
+    metrics.set_page; when the page changes (and when the driver quits) the
+    previous page's summary is logged, checked against budget, and every
+    command is also recorded as a "webdriver_<command>" metrics phase.
+    """
+
+    def __init__(self, driver, budget=None, action="warn"):
+        self.driver = driver
+        self.budget = budget
+        self.action = action
+        self.calls = 0
+        self.seconds = 0.0
+        self.commands = {}
+        self.call_sites = {}
+        self.page = None
+        self.page_calls = {}
+        self.pages = {}
+        self.over_budget = []
+        self.lock = threading.Lock()
+        self._execute = driver.execute
+        self._quit = driver.quit
+        driver.execute = self.execute
+        driver.quit = self.quit
+        driver.command_tracer = self
+
+    def execute(self, driver_command, params=None):
+        site = call_site()
+        started = time.perf_counter()
+        try:
+            return self._execute(driver_command, params)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.registry.observe(f"webdriver_{driver_command}", elapsed)
+            self.record(driver_command, site, elapsed)
+
+    def record(self, command, site, seconds):
+        page = metrics.registry.current_page()
+        with self.lock:
+            if page != self.page:
+                self.end_page()
+                self.page = page
+            self.calls += 1
+            self.seconds += seconds
+            for key, table in ((command, self.commands), ((site, command), self.call_sites),
+                               ((site, command), self.page_calls)):
+                entry = table.setdefault(key, [0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds
+
+    def end_page(self):
+        """Log (and budget-check) the current page's commands; the caller holds the lock"""
+        if not self.page_calls:
+            return
+        calls = sum(count for count, _ in self.page_calls.values())
+        seconds = sum(spent for _, spent in self.page_calls.values())
+        self.pages[self.page] = (calls, seconds)
+        top = sorted(self.page_calls.items(), key=lambda item: -item[1][0])[:TOP_CALL_SITES]
+        log.info("Page %s: %s WebDriver round trips in %.2fs; most from %s", self.page, calls, seconds,
+                 ", ".join(f"{site} {command} x{count}" for (site, command), (count, _) in top),
+                 extra={"page": self.page, "webdriver_calls": calls, "webdriver_seconds": round(seconds, 3)})
+        if self.budget is not None and calls > self.budget:
+            self.over_budget.append((self.page, calls))
+            log.warning("Page %s took %s WebDriver round trips, over its budget of %s", self.page, calls, self.budget,
+                        extra={"page": self.page, "webdriver_calls": calls, "budget": self.budget})
+        self.page_calls = {}
+
+    def summary(self):
+        """Totals by command and by call site, busiest first"""
+        with self.lock:
+            self.end_page()
+            return {
+                "calls": self.calls,
+                "seconds": round(self.seconds, 6),
+                "commands": {command: {"calls": count, "seconds": round(spent, 6)}
+                             for command, (count, spent) in sorted(self.commands.items(), key=lambda item: -item[1][0])},
+                "call_sites": [{"site": site, "command": command, "calls": count, "seconds": round(spent, 6)}
+                               for (site, command), (count, spent)
+                               in sorted(self.call_sites.items(), key=lambda item: -item[1][0])],
+                "pages": {str(page): {"calls": calls, "seconds": round(spent, 6)}
+                          for page, (calls, spent) in self.pages.items()},
+                "over_budget": [{"page": page, "calls": calls} for page, calls in self.over_budget],
+            }
+
+    def check(self):
+        """Raise BudgetExceeded if any page went over budget"""
+        with self.lock:
+            self.end_page()
+            if self.over_budget:
+                raise BudgetExceeded(f"{len(self.over_budget)} pages over the budget of {self.budget} WebDriver "
+                                     f"round trips: " + ", ".join(f"page {page} ({calls})" for page, calls in self.over_budget))
+
+    def quit(self):
+        # Never raises for the budget: callers quit first and still have rows to flush
+        try:
+            self._quit()
+        finally:
+            summary = self.summary()
+            log.info("%s WebDriver round trips in %.2fs over %s pages", summary["calls"], summary["seconds"],
+                     len(summary["pages"]), extra={"webdriver_calls": summary["calls"]})
+            if self.action == "fail" and self.over_budget:
+                with _failures_lock:
+                    _failures.append((self.budget, list(self.over_budget)))
+
+
+def check_all():
+    """Raise BudgetExceeded if a driver quit over budget with the "fail" action; call once cleanup is done"""
+    with _failures_lock:
+        failures = list(_failures)
+        _failures.clear()
+    if failures:
+        pages = [f"page {page} ({calls}/{budget})" for budget, over in failures for page, calls in over]
+        raise BudgetExceeded(f"{len(pages)} pages over their WebDriver round-trip budget: " + ", ".join(pages))
+
+
+def trace(driver, budget=None, action=None):
+    """The driver's CommandTracer, installing one budgeted by PAGE_BUDGET/BUDGET_ACTION unless given"""
+    tracer = getattr(driver, "command_tracer", None)
+    if tracer is None:
+        return CommandTracer(driver, PAGE_BUDGET if budget is None else budget, action or BUDGET_ACTION)
+    if budget is not None:
+        tracer.budget = budget
+    if action:
+        tracer.action = action
+    return tracer
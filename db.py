@@ -0,0 +1,261 @@
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import pool, sql
+import logs
+import normalize
+
+log = logs.get_logger("db")
+
+# Defaults, overridden by the JSON file named in DB_CONFIG_FILE and then by
+# DB_HOST / DB_PORT / DB_NAME / DB_USER / DB_PASSWORD / DB_MINCONN / DB_MAXCONN
+DEFAULT_CONFIG = {
+    "host": "localhost",
+    "port": "5432",
+    "dbname": "data_scrap",
+    "user": "postgres",
+    "password": "password",
+    "minconn": 1,
+    "maxconn": 8,
+}
+
+ENV_KEYS = {
+    "DB_HOST": "host",
+    "DB_PORT": "port",
+    "DB_NAME": "dbname",
+    "DB_USER": "user",
+    "DB_PASSWORD": "password",
+    "DB_MINCONN": "minconn",
+    "DB_MAXCONN": "maxconn",
+}
+
+# Seconds get_conn waits for a connection when all maxconn are borrowed
+POOL_WAIT = 30.0
+
+# Table name -> (CREATE TABLE statement, [follow-up DDL: added columns, indexes])
+SCHEMAS = {}
+
+_pool = None
+# One permit per pooled connection: getconn raises instead of waiting when the pool is exhausted
+_pool_slots = None
+_pool_lock = threading.Lock()
+_created_tables = set()
+_schema_lock = threading.Lock()
+
+
+def load_config(path=None):
+    """Build the connection settings from defaults, an optional JSON file and the environment"""
+    config = dict(DEFAULT_CONFIG)
+    path = path or os.environ.get("DB_CONFIG_FILE")
+    if path:
+        with open(path) as f:
+            config.update(json.load(f))
+    for env_key, key in ENV_KEYS.items():
+        if env_key in os.environ:
+            config[key] = os.environ[env_key]
+    config["minconn"] = int(config["minconn"])
+    config["maxconn"] = int(config["maxconn"])
+    return config
+
+
+def register_table(name, create_sql, indexes=()):
+    """Declare a table so ensure_schema can create it and its follow-up DDL on first use"""
+    SCHEMAS[name] = (create_sql, list(indexes))
+
+
+def get_pool():
+    """Return the process-wide ThreadedConnectionPool, creating it on first use"""
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is None:
+            config = load_config()
+            minconn = config.pop("minconn")
+            maxconn = config.pop("maxconn")
+            _pool = pool.ThreadedConnectionPool(minconn, maxconn, **config)
+            _pool_slots = threading.BoundedSemaphore(maxconn)
+        return _pool
+
+
+def get_conn():
+    """Borrow a pooled connection, waiting up to POOL_WAIT seconds for one to be returned"""
+    connections = get_pool()
+    slots = _pool_slots
+    if not slots.acquire(timeout=POOL_WAIT):
+        raise pool.PoolError(f"no database connection free after {POOL_WAIT:g}s")
+    try:
+        return connections.getconn()
+    except Exception:
+        slots.release()
+        raise
+
+
+def put_conn(conn):
+    if _pool is not None and conn is not None:
+        _pool.putconn(conn)
+        _pool_slots.release()
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for the duration of a with block"""
+    conn = get_conn()
+    try:
+        yield conn
+    finally:
+        put_conn(conn)
+
+
+def close_pool():
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _pool_slots = None
+
+
+def feedback_key(row):
+    """feedback_rating, comment, left_by, plus the date when it is absolute
+
+    A relative date ("2 days ago") changes every day, so it is left out; two
+    identical ratings and comments by one buyer with relative dates are then
+    stored once.
+    """
+    rating, comment, date, left_by = row[:4]
+    return (rating, comment, left_by) + (() if normalize.is_relative_date(date) else (date,))
+
+
+# What a scraped row's fingerprint is taken over, for tables where some
+# scraped text is not stable; other tables hash the whole row
+FINGERPRINT_KEYS = {
+    "feedback": feedback_key,
+}
+
+
+def fingerprint(row):
+    """Stable content hash of a scraped row, stored in the row_hash column"""
+    joined = "\x1f".join("" if value is None else str(value) for value in row)
+    return hashlib.md5(joined.encode("utf-8")).hexdigest()
+
+
+def known_fingerprints(table, hashes):
+    """Return the subset of hashes already stored in table"""
+    if not hashes:
+        return set()
+    with connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL("SELECT row_hash FROM {} WHERE row_hash = ANY(%s)").format(sql.Identifier(table)),
+                    (list(hashes),)
+                )
+                return {row[0] for row in cursor.fetchall()}
+        finally:
+            conn.rollback()
+
+
+def new_rows(table, rows, check_stored=True):
+    """Append each row's fingerprint and drop rows that are already stored or repeated
+
+    With check_stored false (runs writing to files) only repeats are dropped
+    and the database is never touched.
+    """
+    key = FINGERPRINT_KEYS.get(table)
+    fingerprinted = [tuple(row) + (fingerprint(row if key is None else key(row)),) for row in rows]
+    known = known_fingerprints(table, {row[-1] for row in fingerprinted}) if check_stored else set()
+    fresh = []
+    for row in fingerprinted:
+        if row[-1] not in known:
+            known.add(row[-1])
+            fresh.append(row)
+    return fresh
+
+
+def ensure_schema(conn, *tables):
+    """Create the given registered tables and their indexes once per process"""
+    with _schema_lock:
+        for table in tables:
+            if table in _created_tables:
+                continue
+            create_sql, indexes = SCHEMAS[table]
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(create_sql)
+                    for index_sql in indexes:
+                        cursor.execute(index_sql)
+                conn.commit()
+                _created_tables.add(table)
+            except psycopg2.Error as e:
+                log.error("Error creating table %s: %s", table, e)
+                conn.rollback()
+
+
+register_table("account_listings", """
+    CREATE TABLE IF NOT EXISTS account_listings (
+        id SERIAL PRIMARY KEY,
+        account_name TEXT NOT NULL,
+        seller_name TEXT NOT NULL,
+        price_in_USD TEXT NOT NULL,
+        scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+""", [
+    "CREATE INDEX IF NOT EXISTS account_listings_scraped_at_idx ON account_listings (scraped_at)",
+    "ALTER TABLE account_listings ADD COLUMN IF NOT EXISTS row_hash TEXT",
+    "CREATE UNIQUE INDEX IF NOT EXISTS account_listings_row_hash_idx ON account_listings (row_hash)",
+    "ALTER TABLE account_listings ADD COLUMN IF NOT EXISTS price_amount NUMERIC(14, 2)",
+    "ALTER TABLE account_listings ADD COLUMN IF NOT EXISTS price_currency VARCHAR(3)",
+    "CREATE INDEX IF NOT EXISTS account_listings_price_amount_idx ON account_listings (price_amount)",
+])
+
+register_table("seller_listings", """
+    CREATE TABLE IF NOT EXISTS seller_listings (
+        id SERIAL PRIMARY KEY,
+        seller_name TEXT NOT NULL,
+        price TEXT NOT NULL,
+        scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+""", [
+    "CREATE INDEX IF NOT EXISTS seller_listings_scraped_at_idx ON seller_listings (scraped_at)",
+    "ALTER TABLE seller_listings ADD COLUMN IF NOT EXISTS row_hash TEXT",
+    "CREATE UNIQUE INDEX IF NOT EXISTS seller_listings_row_hash_idx ON seller_listings (row_hash)",
+    "ALTER TABLE seller_listings ADD COLUMN IF NOT EXISTS price_amount NUMERIC(14, 2)",
+    "ALTER TABLE seller_listings ADD COLUMN IF NOT EXISTS price_currency VARCHAR(3)",
+    "CREATE INDEX IF NOT EXISTS seller_listings_price_amount_idx ON seller_listings (price_amount)",
+])
+
+register_table("seller_data", """
+    CREATE TABLE IF NOT EXISTS seller_data (
+        id SERIAL PRIMARY KEY,
+        game_name TEXT,
+        server TEXT,
+        price TEXT,
+        scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+""", [
+    "CREATE INDEX IF NOT EXISTS seller_data_scraped_at_idx ON seller_data (scraped_at)",
+    "ALTER TABLE seller_data ADD COLUMN IF NOT EXISTS row_hash TEXT",
+    "CREATE UNIQUE INDEX IF NOT EXISTS seller_data_row_hash_idx ON seller_data (row_hash)",
+    "ALTER TABLE seller_data ADD COLUMN IF NOT EXISTS price_amount NUMERIC(14, 2)",
+    "ALTER TABLE seller_data ADD COLUMN IF NOT EXISTS price_currency VARCHAR(3)",
+    "CREATE INDEX IF NOT EXISTS seller_data_price_amount_idx ON seller_data (price_amount)",
+])
+
+register_table("feedback", """
+    CREATE TABLE IF NOT EXISTS feedback (
+        id SERIAL PRIMARY KEY,
+        feedback_rating VARCHAR(20),
+        comment TEXT,
+        date VARCHAR(50),
+        left_by VARCHAR(100),
+        scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+""", [
+    "CREATE INDEX IF NOT EXISTS feedback_scraped_at_idx ON feedback (scraped_at)",
+    "ALTER TABLE feedback ADD COLUMN IF NOT EXISTS row_hash TEXT",
+    "CREATE UNIQUE INDEX IF NOT EXISTS feedback_row_hash_idx ON feedback (row_hash)",
+    "ALTER TABLE feedback ADD COLUMN IF NOT EXISTS posted_at TIMESTAMP",
+    "CREATE INDEX IF NOT EXISTS feedback_posted_at_idx ON feedback (posted_at)",
+])
@@ -0,0 +1,82 @@
+import queue
+import threading
+
+_STOP = object()
+
+
+class _Checkpoint:
+    def __init__(self, *args):
+        self.args = args
+
+
+class WriterError(Exception):
+    """Raised in the scraping thread when the background writer has failed"""
+
+
+class BackgroundWriter:
+    """Drain row batches into a sink on a dedicated thread
+
+    Exposes the same add/add_many/close interface as CopySink, so a scraper
+    can hand it to save_to_db unchanged. The queue is bounded: when the
+    database falls behind, add_many blocks the scraper instead of letting
+    batches pile up in memory. A failure on the writer thread is re-raised
+    from the next add_many and from close().
+    """
+
+    def __init__(self, sink, max_batches=64, idle_flush=0.5):
+        self.sink = sink
+        self.batches = queue.Queue(maxsize=max_batches)
+        self.idle_flush = idle_flush
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name=f"writer-{sink.table}", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                batch = self.batches.get(timeout=self.idle_flush)
+            except queue.Empty:
+                # Nothing arrived; honour the sink's time threshold while idle
+                batch = None
+
+            if batch is _STOP:
+                break
+            if self.error is not None:
+                continue
+
+            try:
+                if batch is None:
+                    self.sink.flush_if_due()
+                elif isinstance(batch, _Checkpoint):
+                    self.sink.checkpoint(*batch.args)
+                else:
+                    self.sink.add_many(batch)
+            except Exception as e:
+                self.error = e
+
+    def _raise_if_failed(self):
+        if self.error is not None:
+            raise WriterError(f"Background writer for {self.sink.table} failed: {self.error}") from self.error
+
+    def add(self, row):
+        self.add_many([row])
+
+    def add_many(self, rows):
+        self._raise_if_failed()
+        self.batches.put(list(rows))
+
+    def checkpoint(self, scraper, target_url, page, row_index):
+        """Queue a checkpoint behind the batches already handed to the writer"""
+        self._raise_if_failed()
+        self.batches.put(_Checkpoint(scraper, target_url, page, row_index))
+
+    def close(self):
+        """Wait for queued batches, flush the sink and stop the writer thread"""
+        self.batches.put(_STOP)
+        self.thread.join()
+        if self.error is None:
+            try:
+                self.sink.close()
+            except Exception as e:
+                self.error = e
+        self._raise_if_failed()
@@ -0,0 +1,108 @@
+import os
+from selenium import webdriver
+import command_trace
+import logs
+
+log = logs.get_logger("driver_factory")
+
+# SCRAPER_BROWSER_PROFILE=default gives the old headed, unblocked browser for debugging
+BROWSER_PROFILE = os.environ.get("SCRAPER_BROWSER_PROFILE", "performance")
+
+# URL of a running browser_daemon (e.g. http://127.0.0.1:9615); when set,
+# create_driver leases one of its warm sessions instead of launching Chrome
+BROWSER_DAEMON = os.environ.get("SCRAPER_BROWSER_DAEMON")
+
+# Passed to CDP Network.setBlockedURLs; '*' is the only wildcard it understands
+BLOCKED_URL_PATTERNS = [
+    # images
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    # media
+    "*.mp4", "*.webm", "*.mp3", "*.m4a", "*.ogg",
+    # fonts
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    # third-party analytics and ads
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*facebook.net*", "*connect.facebook.com*",
+    "*hotjar.com*", "*clarity.ms*", "*segment.io*", "*mixpanel.com*",
+    "*intercom.io*", "*criteo.com*", "*adservice.google.com*",
+]
+
+PERFORMANCE_ARGS = [
+    "--headless=new",
+    "--window-size=1920,1080",
+    "--no-sandbox",
+    "--disable-dev-shm-usage",
+    "--disable-gpu",
+    "--disable-extensions",
+    "--disable-component-extensions-with-background-pages",
+    "--disable-background-networking",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--mute-audio",
+    "--no-first-run",
+    "--blink-settings=imagesEnabled=false",
+    # Keep background tabs (used for prefetching) running at full speed
+    "--disable-background-timer-throttling",
+    "--disable-renderer-backgrounding",
+    "--disable-backgrounding-occluded-windows",
+    # Bound per-browser memory so more browsers fit on one host
+    "--renderer-process-limit=2",
+    "--js-flags=--max-old-space-size=512",
+]
+
+
+def chrome_options(profile=None, user_data_dir=None, extra_args=()):
+    """ChromeOptions for the named profile: 'performance' (lean, headless) or 'default'"""
+    profile = profile or BROWSER_PROFILE
+    options = webdriver.ChromeOptions()
+
+    if profile == "performance":
+        options.page_load_strategy = "eager"
+        for arg in PERFORMANCE_ARGS:
+            options.add_argument(arg)
+        options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.managed_default_content_settings.media_stream": 2,
+        })
+    else:
+        options.add_argument("--start-maximized")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+
+    if user_data_dir:
+        options.add_argument(f"--user-data-dir={user_data_dir}")
+    for arg in extra_args:
+        options.add_argument(arg)
+    return options
+
+
+def block_heavy_resources(driver, patterns=None):
+    """Stop the current tab fetching images, media, fonts and tracker scripts
+
+    The block is per tab, so the patterns are kept as driver.blocked_urls
+    for tabs opened later (see prefetch.TabPrefetcher) to apply as well.
+    """
+    driver.blocked_urls = patterns or BLOCKED_URL_PATTERNS
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": driver.blocked_urls})
+
+
+def create_driver(profile=None, user_data_dir=None, extra_args=(), blocked_urls=None):
+    """Start a Chrome WebDriver with the lean performance profile unless told otherwise"""
+    profile = profile or BROWSER_PROFILE
+    # A dedicated profile directory needs its own browser, so those still launch locally
+    if BROWSER_DAEMON and not user_data_dir and not extra_args:
+        import browser_daemon
+        driver = browser_daemon.lease_driver(BROWSER_DAEMON)
+        if profile == "performance":
+            # The daemon blocked its own tab; new tabs on this lease need the same
+            driver.blocked_urls = blocked_urls or BLOCKED_URL_PATTERNS
+        log.debug("Leased a warm Chrome session from %s", BROWSER_DAEMON)
+    else:
+        driver = webdriver.Chrome(options=chrome_options(profile, user_data_dir, extra_args))
+        if profile == "performance":
+            block_heavy_resources(driver, blocked_urls)
+        log.debug("Started Chrome with the %s profile", profile)
+    if command_trace.TRACE_COMMANDS:
+        command_trace.trace(driver)
+    return driver
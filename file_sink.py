@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import threading
+import time
+import logs
+import normalize
+
+log = logs.get_logger("file_sink")
+
+OUTPUT_FORMATS = ("postgres", "parquet", "jsonl")
+
+OUTPUT_DIR = os.environ.get("SCRAPER_OUTPUT_DIR", "output")
+
+
+class JsonlSink:
+    """Append rows to a newline-delimited JSON file, one object per row
+
+    Rows go straight through a buffered file handle, so memory stays flat
+    however long the crawl runs; max_rows and max_age only decide how often
+    the file is flushed to disk. Same add/add_many/flush/close interface as
+    CopySink, so it can sit behind a BackgroundWriter.
+    """
+
+    def __init__(self, path, table, columns, max_rows=1000, max_age=5.0):
+        self.path = path
+        self.table = table
+        self.columns = list(columns)
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.unflushed = 0
+        self.written = 0
+        self.first_row_at = None
+        self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+
+    def add(self, row):
+        self.add_many([row])
+
+    def add_many(self, rows):
+        with self.lock:
+            if not self.unflushed:
+                self.first_row_at = time.monotonic()
+            for row in rows:
+                self.file.write(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False, default=str))
+                self.file.write("\n")
+                self.unflushed += 1
+            if self.unflushed >= self.max_rows:
+                self.flush()
+            else:
+                self.flush_if_due()
+
+    def checkpoint(self, scraper, target_url, page, row_index):
+        """Crawl checkpoints live in Postgres; file runs cannot be resumed"""
+
+    def flush_if_due(self):
+        with self.lock:
+            if self.unflushed and time.monotonic() - self.first_row_at >= self.max_age:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            count = self.unflushed
+            self.file.flush()
+            self.written += count
+            self.unflushed = 0
+            return count
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.file.close()
+            log.info("Wrote %s rows to %s", self.written, self.path)
+
+
+class ParquetSink:
+    """Stream rows into a Parquet file, one row group per row_group_size rows
+
+    At most one row group is held in memory; each is written as soon as it
+    fills (or max_age passes), so a crawl of any length keeps a bounded
+    footprint. Columns are strings unless types maps a column to a pyarrow
+    type or type alias such as 'float64'. The file is only readable once close() writes its footer.
+    """
+
+    def __init__(self, path, table, columns, row_group_size=50000, compression="zstd", max_age=60.0, types=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.path = path
+        self.table = table
+        self.columns = list(columns)
+        self.row_group_size = row_group_size
+        self.max_age = max_age
+        self.rows = []
+        self.written = 0
+        self.first_row_at = None
+        self.lock = threading.RLock()
+        types = types or {}
+        fields = []
+        for column in self.columns:
+            column_type = types.get(column, pa.string())
+            if isinstance(column_type, str):
+                column_type = pa.type_for_alias(column_type)
+            fields.append((column, column_type))
+        self.schema = pa.schema(fields)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.writer = pq.ParquetWriter(path, self.schema, compression=compression)
+
+    def add(self, row):
+        self.add_many([row])
+
+    def add_many(self, rows):
+        with self.lock:
+            if not self.rows:
+                self.first_row_at = time.monotonic()
+            self.rows.extend(rows)
+            while len(self.rows) >= self.row_group_size:
+                self._write(self.rows[:self.row_group_size])
+                del self.rows[:self.row_group_size]
+            self.flush_if_due()
+
+    def checkpoint(self, scraper, target_url, page, row_index):
+        """Crawl checkpoints live in Postgres; file runs cannot be resumed"""
+
+    def _write(self, rows):
+        arrays = [
+            self.pa.array([row[i] for row in rows], type=field.type)
+            for i, field in enumerate(self.schema)
+        ]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        self.written += len(rows)
+        self.first_row_at = time.monotonic()
+
+    def flush_if_due(self):
+        with self.lock:
+            if self.rows and time.monotonic() - self.first_row_at >= self.max_age:
+                self.flush()
+
+    def flush(self):
+        """Write whatever is buffered as a (possibly short) row group"""
+        with self.lock:
+            count = len(self.rows)
+            if count:
+                self._write(self.rows)
+                self.rows = []
+            return count
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.writer.close()
+            log.info("Wrote %s rows to %s", self.written, self.path)
+
+
+def add_arguments(parser):
+    """Add the --output/--output-dir options every scraper shares"""
+    parser.add_argument("--output", choices=OUTPUT_FORMATS, default="postgres",
+                        help="where rows go: the database (default) or a Parquet/JSONL file")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="directory for --output parquet/jsonl files")
+
+
+def add_crawl_arguments(parser, incremental, price_history=False):
+    """Add the --resume/--incremental (and, if price_history, --price-history) options of the crawlers
+
+    incremental is the scraper's default for --incremental/--no-incremental.
+    """
+    parser.add_argument("--resume", action="store_true", help="continue after the last committed page")
+    parser.add_argument("--incremental", action=argparse.BooleanOptionalAction, default=incremental,
+                        help="stop at the first page with no new rows (default: %(default)s)")
+    if price_history:
+        parser.add_argument("--price-history", action="store_true",
+                            help="record only price changes in price_history instead of appending to the listing table")
+
+
+def create_sink(parser, args, table, columns, price_history=None):
+    """Open the BackgroundWriter args.output asks for, returning (sink, pooled connection or None)
+
+    --resume and --price-history need --output postgres and are rejected
+    through parser otherwise. price_history is the (key columns, price
+    column) pair a --price-history run tracks. (None, None) if the database
+    cannot be reached.
+    """
+    from db_writer import BackgroundWriter
+
+    resume = getattr(args, "resume", False)
+    track_prices = getattr(args, "price_history", False)
+    if args.output != "postgres":
+        if resume:
+            parser.error("--resume needs the checkpoints kept with --output postgres")
+        if track_prices:
+            parser.error("--price-history writes to the database, so it needs --output postgres")
+        return BackgroundWriter(create(args.output, table, columns, args.output_dir, normalize.COLUMN_TYPES)), None
+
+    import psycopg2
+    import db
+    from bulk_sink import CopySink
+
+    try:
+        conn = db.get_conn()
+    except psycopg2.Error as e:
+        log.error("Database connection error: %s", e)
+        return None, None
+
+    db.ensure_schema(conn, table, 'crawl_checkpoints')
+    if track_prices:
+        from price_history import PriceHistorySink
+
+        db.ensure_schema(conn, 'price_history', 'price_current')
+        return BackgroundWriter(PriceHistorySink(conn, table, columns, *price_history)), conn
+    return BackgroundWriter(CopySink(conn, table, columns, conflict_column='row_hash')), conn
+
+
+def create(output, table, columns, directory=None, types=None):
+    """File sink for output ('parquet' or 'jsonl') writing <directory>/<table>-<timestamp>.<ext>"""
+    directory = directory or OUTPUT_DIR
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    if output == "parquet":
+        return ParquetSink(os.path.join(directory, f"{table}-{stamp}.parquet"), table, columns, types=types)
+    if output == "jsonl":
+        return JsonlSink(os.path.join(directory, f"{table}-{stamp}.jsonl"), table, columns)
+    raise ValueError(f"Unknown file output {output!r}")
@@ -0,0 +1,232 @@
+import argparse
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Synthetic stand-ins for the sites the four scrapers target. Each page keeps
+# exactly the DOM shape the scrapers' XPaths and selectors expect:
+#   /quasar?page=N          Quasar #q-app listing rendered client-side (scraper1, scraper2)
+#   /api/listings?page=N    the JSON that listing is rendered from
+#   /offers?page=N          server-rendered offers with the #isEurope cookie popup (scraper3)
+#   /feedback?page=N        server-rendered feedback grid (scraper4)
+
+QUASAR_SHELL = """<!DOCTYPE html>
+<html><head><title>Listings</title></head><body>
+<div id="q-app"><div><div><main><div>
+  <div></div><div></div><div></div><div></div>
+  <div><div><div></div><div><div><div></div><div><div id="listings"></div></div></div></div></div></div>
+  <div class="q-pagination" id="pagination"></div>
+</div></main></div></div></div>
+<script>
+let page = Number(new URLSearchParams(location.search).get("page") || 1);
+
+function esc(text) {
+    const span = document.createElement("span");
+    span.textContent = text;
+    return span.innerHTML;
+}
+
+async function render(n) {
+    const response = await fetch("/api/listings?page=" + n);
+    const data = await response.json();
+    page = data.page;
+    document.getElementById("listings").innerHTML = data.items.map(item =>
+        '<div class="listing-card"><div>' +
+        '<a href="#"><div><div><span>' + esc(item.account) + '</span></div></div></a>' +
+        '<div>' +
+        '<a href="#"><div><div></div><div><div class="q-ml-sm">' + esc(item.seller) + '</div></div></div></a>' +
+        '<a href="#"><span class="text-body1">' + esc(item.price) + '</span><span class="text-subtitle2">Unit price</span></a>' +
+        '</div></div></div>'
+    ).join("");
+
+    let buttons = "";
+    for (let i = 1; i <= data.total_pages; i++) {
+        buttons += '<button class="q-btn" onclick="render(' + i + ')">' + i + '</button>';
+    }
+    if (data.page < data.total_pages) {
+        buttons += '<button class="q-btn" onclick="render(' + (data.page + 1) + ')"><i>keyboard_arrow_right</i></button>';
+    }
+    document.getElementById("pagination").innerHTML = buttons;
+    history.replaceState(null, "", "/quasar?page=" + data.page);
+}
+
+render(page);
+</script>
+</body></html>
+"""
+
+COOKIE_POPUP = """
+<div id="isEurope" style="position:fixed;bottom:0;left:0;right:0;background:#eee;padding:1em">
+  We use cookies.
+  <button id="acceptCookiesButton"
+          onclick="document.cookie='cookie_consent=1; path=/; max-age=31536000'; document.getElementById('isEurope').style.display='none'">Accept</button>
+</div>
+"""
+
+DATES = ["just now", "5 minutes ago", "3 hours ago", "2 days ago", "1 week ago", "2024-03-15"]
+RATINGS = ["Positive", "Neutral", "Negative"]
+
+
+def listing_items(run_id, page, rows):
+    return [
+        {
+            "account": f"Account {run_id}-{page}-{i}",
+            "seller": f"seller_{(page * rows + i) % 97} Lv.{i % 50 + 1}",
+            "price": f"${(page * 1000 + i * 37) / 100:,.2f}",
+        }
+        for i in range(1, rows + 1)
+    ]
+
+
+def offers_page(run_id, page, pages, rows, consented):
+    offers = "".join(
+        f'<div class="offer-row"><div class="offer-title-colum">Game {run_id}-{page}-{i}</div>'
+        f'<div class="offer-title-id">Server {i % 12}</div>'
+        f'<div class="offer-price-tag price">${(page * 500 + i * 13) / 100:,.2f}</div></div>'
+        for i in range(1, rows + 1)
+    )
+    if page < pages:
+        next_link = f'<a class="page-link" aria-label="Next Page" href="/offers?page={page + 1}">Next</a>'
+    else:
+        next_link = '<a class="page-link" aria-label="Next Page" aria-disabled="true">Next</a>'
+    popup = "" if consented else COOKIE_POPUP
+    return (f"<!DOCTYPE html><html><head><title>Offers</title></head><body>"
+            f"<div class=\"offers\">{offers}</div>"
+            f"<nav><ul class=\"pagination\"><li>{next_link}</li></ul></nav>{popup}</body></html>")
+
+
+def feedback_page(run_id, page, pages, rows):
+    items = "".join(
+        f'<div class="feedback-item">'
+        f'<div><span title="{RATINGS[i % 3]}">{RATINGS[i % 3]}</span></div>'
+        f'<div><div>Comment {run_id}-{page}-{i}: smooth trade, would buy again</div></div>'
+        f'<div><div></div><div><p>Left by<br>buyer_{(page * rows + i) % 211}</p></div></div>'
+        f'<div>{DATES[(page + i) % len(DATES)]}</div>'
+        f'</div>'
+        for i in range(1, rows + 1)
+    )
+    next_link = f'<a class="page-link" href="/feedback?page={page + 1}">Next</a>' if page < pages else ""
+    # Same nesting as the absolute XPath in scraper4.scrape_current_page
+    return ("<!DOCTYPE html><html><head><title>Feedback</title></head><body><main><div>"
+            "<div><div><div><div></div><div></div><div></div><div><div><div>"
+            "<div></div><div><div></div><div><div></div><div>"
+            f"{items}"
+            "</div></div></div></div></div></div></div></div>"
+            f"<ul class=\"pagination\"><li>{next_link}</li></ul>"
+            "</div></main></body></html>")
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # Every response carries Content-Length, so connections can be kept alive
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type="text/html; charset=utf-8", status=200):
+        data = body.encode("utf-8")
+        # Compressed like a real API behind a CDN, so clients' gzip handling is exercised
+        gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            data = gzip.compress(data)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        site = self.server.site
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            page = max(1, int(query.get("page", ["1"])[0]))
+        except ValueError:
+            page = 1
+
+        if site.latency:
+            time.sleep(site.latency)
+
+        if url.path == "/quasar":
+            self.send_body(QUASAR_SHELL)
+        elif url.path == "/api/listings":
+            page = min(page, site.pages)
+            payload = {
+                "page": page,
+                "total_pages": site.pages,
+                "items": listing_items(site.run_id, page, site.rows),
+            }
+            self.send_body(json.dumps(payload), "application/json")
+        elif url.path == "/offers":
+            consented = "cookie_consent=1" in self.headers.get("Cookie", "")
+            self.send_body(offers_page(site.run_id, min(page, site.pages), site.pages, site.rows, consented))
+        elif url.path == "/feedback":
+            self.send_body(feedback_page(site.run_id, min(page, site.pages), site.pages, site.rows))
+        else:
+            self.send_body("Not found", "text/plain", 404)
+
+
+class FixtureSite:
+    """Serve the synthetic pages from a background thread
+
+    pages and rows size every listing; latency delays each response by that
+    many seconds; run_id is folded into row text so repeated benchmark runs
+    produce rows the dedup layer has not seen yet.
+    """
+
+    def __init__(self, pages=5, rows=20, latency=0.0, run_id="0", host="127.0.0.1", port=0):
+        self.pages = pages
+        self.rows = rows
+        self.latency = latency
+        self.run_id = run_id
+        self.server = ThreadingHTTPServer((host, port), FixtureHandler)
+        self.server.site = self
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the synthetic scraper fixture pages")
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    site = FixtureSite(args.pages, args.rows, args.latency, port=args.port)
+    print(f"Serving fixture site on {site.base_url}")
+    try:
+        site.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        site.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
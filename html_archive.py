@@ -0,0 +1,158 @@
+import argparse
+import gzip
+import importlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import db
+import file_sink
+import logs
+from db_writer import WriterError
+
+log = logs.get_logger("html_archive")
+
+ARCHIVE_DIR = os.environ.get("SCRAPER_ARCHIVE_DIR", "archive")
+
+# Scraper module -> its function that saves what parse_page_source returns
+REPLAYERS = {
+    "scraper1": "save_to_db",
+    "scraper2": "save_to_db",
+    "scraper3": "save_offers",
+    "scraper4": "save_feedback",
+}
+# Scrapers whose saver resolves relative dates; they get the page's capture time as now=
+DATED_REPLAYERS = {"scraper4"}
+
+
+class HtmlArchive:
+    """Append-only archive of page_source snapshots, one gzip member per page
+
+    Each record is a JSON line (scraper, page, url, ts, html) compressed on
+    its own and appended, so a crashed crawl leaves every completed page
+    readable and the file is never rewritten. Safe to share between threads.
+    """
+
+    def __init__(self, path, scraper):
+        self.path = path
+        self.scraper = scraper
+        self.lock = threading.Lock()
+        self.pages = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "ab")
+
+    def record(self, page, url, html):
+        line = json.dumps({
+            "scraper": self.scraper,
+            "page": page,
+            "url": url,
+            "ts": round(time.time(), 3),
+            "html": html,
+        }, ensure_ascii=False)
+        member = gzip.compress(line.encode("utf-8") + b"\n")
+        with self.lock:
+            self.file.write(member)
+            self.file.flush()
+            self.pages += 1
+
+    def record_page(self, driver, page):
+        """Archive the driver's current page; never lets a failure stop the crawl"""
+        try:
+            self.record(page, driver.current_url, driver.page_source)
+        except Exception as e:
+            log.warning("Could not archive page %s: %s", page, e)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        log.info("Archived %s pages to %s", self.pages, self.path)
+
+
+def create(scraper, directory=None):
+    """Archive for this run at <directory>/<scraper>-<timestamp>.jsonl.gz"""
+    directory = directory or ARCHIVE_DIR
+    return HtmlArchive(os.path.join(directory, f"{scraper}-{time.strftime('%Y%m%dT%H%M%S')}.jsonl.gz"), scraper)
+
+
+def add_arguments(parser):
+    """Add the --record/--archive-dir options every scraper shares"""
+    parser.add_argument("--record", action="store_true",
+                        help="archive every page's HTML so extraction can be replayed offline")
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="directory for --record archives")
+
+
+def read(path):
+    """Yield the records of an archive in the order they were written"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def _parse(scraper, html):
+    return list(importlib.import_module(scraper).parse_page_source(html))
+
+
+def replay(scraper, paths, workers=None):
+    """Re-extract every archived page of scraper across processes, yielding (record, rows) in archive order"""
+    # Only a few pages per worker are in flight, so archives of any size replay in bounded memory
+    window = (workers or os.cpu_count() or 1) * 4
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path in paths:
+            for record in read(path):
+                if record["scraper"] != scraper:
+                    continue
+                html = record.pop("html")
+                pending.append((record, pool.submit(_parse, scraper, html)))
+                if len(pending) >= window:
+                    record, future = pending.popleft()
+                    yield record, future.result()
+        while pending:
+            record, future = pending.popleft()
+            yield record, future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run a scraper's extraction over recorded HTML archives")
+    parser.add_argument("scraper", choices=sorted(REPLAYERS))
+    parser.add_argument("archives", nargs="+", help="archive files written with --record")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: one per core)")
+    file_sink.add_arguments(parser)
+    args = parser.parse_args()
+
+    module = importlib.import_module(args.scraper)
+    save = getattr(module, REPLAYERS[args.scraper])
+    sink, conn = file_sink.create_sink(parser, args, module.TABLE_NAME, module.COLUMNS)
+    if sink is None:
+        return
+    to_db = args.output == "postgres"
+
+    started = time.perf_counter()
+    pages = rows_total = 0
+    try:
+        for record, rows in replay(args.scraper, args.archives, args.workers):
+            pages += 1
+            rows_total += len(rows)
+            if rows and args.scraper in DATED_REPLAYERS:
+                save(sink, rows, to_db, now=datetime.fromtimestamp(record["ts"]))
+            elif rows:
+                save(sink, rows, to_db)
+            log.info("Page %s (%s): %s rows", record["page"], record["url"], len(rows),
+                     extra={"page": record["page"], "rows": len(rows)})
+    finally:
+        try:
+            sink.close()
+        except WriterError as e:
+            log.error("Error writing data: %s", e)
+        if conn is not None:
+            db.put_conn(conn)
+        db.close_pool()
+
+    log.info("Replayed %s pages (%s rows) in %.2fs", pages, rows_total, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import json
+import logging
+import os
+import sys
+
+# SCRAPER_LOG_LEVEL picks the threshold (per-row records are DEBUG, so the
+# default INFO keeps them off); SCRAPER_LOG_FORMAT=json emits one JSON object
+# per record, with any `extra` fields as keys
+LOG_LEVEL = os.environ.get("SCRAPER_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("SCRAPER_LOG_FORMAT", "text")
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+_configured = False
+
+
+def configure():
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger("scrapers")
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+    _configured = True
+
+
+def get_logger(name):
+    """Logger under the shared "scrapers" hierarchy, configured from the environment"""
+    configure()
+    return logging.getLogger(f"scrapers.{name}")
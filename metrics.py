@@ -0,0 +1,192 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import logs
+
+log = logs.get_logger("metrics")
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRICS_DIR = os.environ.get("SCRAPER_METRICS_DIR", "metrics")
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.rows = 0
+
+    def observe(self, seconds, rows):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+        self.count += 1
+        self.sum += seconds
+        self.rows += rows
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum_seconds": round(self.sum, 6),
+            "rows": self.rows,
+            "buckets": {str(bound): n for bound, n in zip(BUCKETS, self.buckets)},
+        }
+
+
+class Registry:
+    """Per-phase latency histograms and row counts, overall and per page
+
+    The current page is a context variable, so it is per thread and also per
+    asyncio task (and carried into asyncio.to_thread calls).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.page = contextvars.ContextVar("metrics_page", default=None)
+        self.phases = {}
+        self.pages = {}
+
+    def set_page(self, page):
+        """Attribute the calling thread's (or task's) following observations to page"""
+        self.page.set(page)
+
+    def current_page(self):
+        return self.page.get()
+
+    def observe(self, phase, seconds, rows=0):
+        page = self.page.get()
+        with self.lock:
+            self.phases.setdefault(phase, Histogram()).observe(seconds, rows)
+            if page is not None:
+                self.pages.setdefault(page, {}).setdefault(phase, Histogram()).observe(seconds, rows)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "phases": {phase: h.to_dict() for phase, h in sorted(self.phases.items())},
+                "pages": {
+                    str(page): {phase: {"calls": h.count, "seconds": round(h.sum, 6), "rows": h.rows}
+                                for phase, h in sorted(phases.items())}
+                    for page, phases in sorted(self.pages.items())
+                },
+            }
+
+    def prometheus(self, scraper):
+        """Render the phase histograms in the Prometheus text exposition format"""
+        lines = [
+            "# HELP scraper_phase_seconds Wall time spent per call in each scraper phase.",
+            "# TYPE scraper_phase_seconds histogram",
+        ]
+        with self.lock:
+            phases = sorted(self.phases.items())
+            for phase, h in phases:
+                labels = f'scraper="{scraper}",phase="{phase}"'
+                for bound, n in zip(BUCKETS, h.buckets):
+                    lines.append(f'scraper_phase_seconds_bucket{{{labels},le="{bound}"}} {n}')
+                lines.append(f'scraper_phase_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"scraper_phase_seconds_sum{{{labels}}} {h.sum:.6f}")
+                lines.append(f"scraper_phase_seconds_count{{{labels}}} {h.count}")
+            lines.append("# HELP scraper_phase_rows_total Rows produced or written by each scraper phase.")
+            lines.append("# TYPE scraper_phase_rows_total counter")
+            for phase, h in phases:
+                lines.append(f'scraper_phase_rows_total{{scraper="{scraper}",phase="{phase}"}} {h.rows}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def count_rows(result):
+    """Rows a phase produced: an int result as-is, the length of a sized one, else 0"""
+    if result is None or isinstance(result, bool):
+        return 0
+    if isinstance(result, int):
+        return result
+    try:
+        return len(result)
+    except TypeError:
+        return 0
+
+
+def _timed_generator(phase, generator):
+    """Pass generator through, recording the time spent inside it and the items it yielded"""
+    elapsed = 0.0
+    count = 0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - started
+            count += 1
+            yield item
+    finally:
+        registry.observe(phase, elapsed, count)
+
+
+def timed(phase, rows=count_rows):
+    """Record the wrapped function's latency and row count under phase
+
+    A generator function is timed across its whole iteration instead, not
+    counting the time its consumer holds each item, with one row per item.
+    A coroutine function is timed from its first step until it returns.
+    """
+    def decorator(func):
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                return _timed_generator(phase, func(*args, **kwargs))
+            return generator_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def coroutine_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                result = None
+                try:
+                    result = await func(*args, **kwargs)
+                    return result
+                finally:
+                    registry.observe(phase, time.perf_counter() - started,
+                                     0 if result is None else rows(result))
+            return coroutine_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = None
+            try:
+                result = func(*args, **kwargs)
+                return result
+            finally:
+                registry.observe(phase, time.perf_counter() - started,
+                                 0 if result is None else rows(result))
+        return wrapper
+    return decorator
+
+
+def set_page(page):
+    registry.set_page(page)
+
+
+def write_reports(scraper, directory=None):
+    """Write <scraper>.json and <scraper>.prom for this run into directory"""
+    directory = directory or METRICS_DIR
+    os.makedirs(directory, exist_ok=True)
+    json_path = os.path.join(directory, f"{scraper}.json")
+    prom_path = os.path.join(directory, f"{scraper}.prom")
+
+    with open(json_path, "w") as f:
+        json.dump({"scraper": scraper, **registry.summary()}, f, indent=2)
+    with open(prom_path, "w") as f:
+        f.write(registry.prometheus(scraper))
+    log.info("Wrote metrics to %s and %s", json_path, prom_path)
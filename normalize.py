@@ -0,0 +1,116 @@
+import re
+from datetime import datetime
+import pandas as pd
+import metrics
+
+# Typed columns appended after row_hash, so fingerprints stay those of the raw text
+PRICE_COLUMNS = ('price_amount', 'price_currency')
+DATE_COLUMNS = ('posted_at',)
+
+# pyarrow type aliases for the typed columns when writing Parquet
+COLUMN_TYPES = {'price_amount': 'float64', 'price_currency': 'string', 'posted_at': 'timestamp[us]'}
+
+# price_amount is NUMERIC(14, 2), so amounts must stay below 10^12 in magnitude
+MAX_AMOUNT = 10 ** 12
+
+CURRENCY_SYMBOLS = {'$': 'USD', '€': 'EUR', '£': 'GBP', '¥': 'JPY', '₽': 'RUB', '₹': 'INR', '₩': 'KRW', '₺': 'TRY'}
+
+# Seconds per unit of "N <unit>s ago"; months and years are approximate
+RELATIVE_UNITS = {
+    'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400,
+    'week': 7 * 86400, 'month': 30 * 86400, 'year': 365 * 86400,
+}
+
+RELATIVE_DATE = re.compile(
+    r"^(?:(?:\d+|an?|one)\s+(?:second|minute|hour|day|week|month|year)s?\s+ago|just now|now|today|yesterday)$"
+)
+
+
+def _optional(values):
+    """Series values as Python objects, with NaN/NaT as None"""
+    return [None if pd.isna(value) else value for value in values]
+
+
+def parse_prices(texts, default_currency=None):
+    """Vectorized "$1,234.50" / "1.234,50 €" / "12 USD" -> (amounts, currency codes)
+
+    With both "." and "," in a number the last one is the decimal separator.
+    With only one of them it is a thousands separator if it repeats
+    ("1.234.567") or groups exactly three digits after a non-zero lead
+    ("1,234"), otherwise a decimal one ("12,5"). Spaces and apostrophes
+    ("1 234", "1'234") always group thousands. Amounts outside MAX_AMOUNT
+    come back as None, like unparseable ones.
+    """
+    series = pd.Series(list(texts), dtype="object").astype("string")
+
+    # French and Swiss prices group with (narrow) no-break spaces and apostrophes
+    grouping = "\\s\u00a0\u202f'’"
+    number = series.str.extract(f"(\\d[\\d.,{grouping}]*)", expand=False)
+    number = number.str.replace(f"[{grouping}]", "", regex=True)
+    number = number.str.rstrip(".,")
+    dots = number.str.count(r"\.")
+    commas = number.str.count(",")
+    last_separator = number.str.extract(r"([.,])\d*$", expand=False)
+    grouped = number.str.fullmatch(r"[1-9]\d{0,2}[.,]\d{3}").fillna(False).astype(bool)
+    single_decimal = (dots + commas == 1) & ~grouped
+    decimal = last_separator.where(((dots > 0) & (commas > 0)) | single_decimal)
+
+    # Drop the thousands separators, then make the decimal separator a point
+    number = number.where(decimal != ",", number.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    number = number.where(decimal == ",", number.str.replace(",", "", regex=False))
+    number = number.where(decimal.notna(), number.str.replace(".", "", regex=False))
+    amounts = pd.to_numeric(number, errors="coerce").round(2)
+    # One out-of-range amount would fail the whole COPY batch
+    amounts = amounts.where(amounts.abs() < MAX_AMOUNT)
+
+    symbols = "".join(CURRENCY_SYMBOLS)
+    currencies = series.str.extract(r"\b([A-Z]{3})\b", expand=False)
+    currencies = currencies.fillna(series.str.extract(f"([{symbols}])", expand=False).map(CURRENCY_SYMBOLS))
+    if default_currency:
+        currencies = currencies.where(amounts.isna(), currencies.fillna(default_currency))
+
+    return [None if pd.isna(a) else float(a) for a in amounts], _optional(currencies)
+
+
+def parse_dates(texts, now=None):
+    """Vectorized "2 days ago" / "just now" / "2024-03-15" -> naive datetimes (None if unparseable)"""
+    now = pd.Timestamp(now or datetime.now())
+    series = pd.Series(list(texts), dtype="object").astype("string").str.strip().str.lower()
+
+    relative = series.str.extract(r"^(\d+|an?|one)\s+(second|minute|hour|day|week|month|year)s?\s+ago$")
+    counts = pd.to_numeric(relative[0].replace({"a": "1", "an": "1", "one": "1"}), errors="coerce")
+    seconds = counts * relative[1].map(RELATIVE_UNITS).astype("float64")
+    seconds = seconds.mask(series.isin(["just now", "now", "today"]), 0.0)
+    seconds = seconds.mask(series.isin(["yesterday"]), float(RELATIVE_UNITS['day']))
+    parsed = now - pd.to_timedelta(seconds, unit="s")
+
+    # utc=True copes with offsets mixed into naive dates; naive ones keep their wall time
+    absolute = pd.to_datetime(series.where(parsed.isna()), errors="coerce", format="mixed", utc=True).dt.tz_convert(None)
+    parsed = parsed.fillna(absolute)
+
+    return [None if pd.isna(value) else value.to_pydatetime() for value in parsed]
+
+
+def is_relative_date(text):
+    """True for dates parse_dates resolves against now ("2 days ago", "yesterday")"""
+    return bool(text) and RELATIVE_DATE.match(text.strip().lower()) is not None
+
+
+@metrics.timed("normalize_prices")
+def with_prices(rows, price_index, default_currency=None):
+    """Append PRICE_COLUMNS parsed from each row's raw price text"""
+    rows = list(rows)
+    if not rows:
+        return rows
+    amounts, currencies = parse_prices((row[price_index] for row in rows), default_currency)
+    return [tuple(row) + (amount, currency) for row, amount, currency in zip(rows, amounts, currencies)]
+
+
+@metrics.timed("normalize_dates")
+def with_dates(rows, date_index, now=None):
+    """Append DATE_COLUMNS parsed from each row's raw date text"""
+    rows = list(rows)
+    if not rows:
+        return rows
+    dates = parse_dates((row[date_index] for row in rows), now)
+    return [tuple(row) + (posted_at,) for row, posted_at in zip(rows, dates)]
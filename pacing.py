@@ -0,0 +1,162 @@
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+import logs
+import metrics
+
+log = logs.get_logger("pacing")
+
+# Page loads slower than this (seconds) stop the controller from speeding up
+TARGET_LATENCY = float(os.environ.get("SCRAPER_TARGET_LATENCY", "2.0"))
+
+# Waits are given this many times the smoothed page-load time, within the bounds
+TIMEOUT_FACTOR = 4
+MIN_TIMEOUT = 3.0
+MAX_TIMEOUT = 60.0
+
+# Additive steps on fast page loads; failures multiply instead
+DELAY_STEP = 0.1
+TIMEOUT_STEP = 0.5
+MAX_DELAY = 10.0
+# Fast page loads in a row before one more concurrent page load is allowed
+INCREASE_AFTER = 3
+
+# Weight of the newest sample in the smoothed page-load time
+SMOOTHING = 0.2
+
+# Shortest pause between retries, however fast the site has been
+MIN_BACKOFF = 0.25
+
+
+class Pacer:
+    """AIMD pacing for one site, driven by its page-load times and failures
+
+    Scrapers route their waits, pauses and retries through it:
+
+        pacer.until(driver, EC.presence_of_element_located(locator))
+        pacer.pause()
+        for attempt in pacer.attempts():
+            ...
+
+    Every fast page load (observe) shaves DELAY_STEP off the pause between
+    actions and TIMEOUT_STEP off the wait timeout (never below TIMEOUT_FACTOR
+    times the smoothed load time), and every INCREASE_AFTER of them in a row
+    admit one more concurrent page load, up to max_concurrency. A timeout or
+    stale element (failure) doubles the pause, grows the timeout by half and
+    halves the concurrency. Safe to share between threads.
+    """
+
+    def __init__(self, name, timeout=10.0, delay=0.5, max_attempts=3, max_concurrency=1):
+        self.name = name
+        self.timeout = timeout
+        self.delay = delay
+        self.max_attempts = max_attempts
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = 1
+        self.active = 0
+        self.latency = None
+        self.fast_streak = 0
+        self.failures = 0
+        self.lock = threading.Condition()
+
+    def observe(self, seconds):
+        """Record a completed page load that took seconds"""
+        with self.lock:
+            self.latency = seconds if self.latency is None else SMOOTHING * seconds + (1 - SMOOTHING) * self.latency
+            floor = max(MIN_TIMEOUT, TIMEOUT_FACTOR * self.latency)
+            if seconds > TARGET_LATENCY:
+                self.fast_streak = 0
+                self.timeout = min(MAX_TIMEOUT, max(self.timeout, floor))
+                return
+
+            self.delay = max(0.0, self.delay - DELAY_STEP)
+            self.timeout = max(floor, self.timeout - TIMEOUT_STEP)
+            self.fast_streak += 1
+            if self.fast_streak >= INCREASE_AFTER and self.concurrency < self.max_concurrency:
+                self.fast_streak = 0
+                self.concurrency += 1
+                log.info("%s: raising concurrency to %s", self.name, self.concurrency,
+                         extra={"site": self.name, "concurrency": self.concurrency})
+                self.lock.notify_all()
+
+    def failure(self, kind):
+        """Back off after a timeout, stale element or other sign the site is struggling"""
+        with self.lock:
+            self.failures += 1
+            self.fast_streak = 0
+            self.delay = min(MAX_DELAY, max(self.delay, DELAY_STEP) * 2)
+            self.timeout = min(MAX_TIMEOUT, self.timeout * 1.5)
+            self.concurrency = max(1, self.concurrency // 2)
+            log.warning("%s: %s, backing off to %.2fs delay, %.1fs timeout, concurrency %s",
+                        self.name, kind, self.delay, self.timeout, self.concurrency,
+                        extra={"site": self.name, "failure": kind, "delay": self.delay,
+                               "timeout": self.timeout, "concurrency": self.concurrency})
+        metrics.registry.observe(f"pacing_{kind}", 0.0)
+
+    def wait(self, driver, timeout=None, poll_frequency=0.5):
+        """WebDriverWait bounded by the current timeout"""
+        return WebDriverWait(driver, timeout or self.timeout, poll_frequency=poll_frequency)
+
+    def until(self, driver, condition, timeout=None, observe=True):
+        """wait(driver).until(condition), counting a timeout as a failure unless observe is False"""
+        try:
+            return self.wait(driver, timeout).until(condition)
+        except TimeoutException:
+            if observe:
+                self.failure("timeout")
+            raise
+
+    def load(self, driver, url):
+        """driver.get(url), recording how long the load took"""
+        started = time.perf_counter()
+        try:
+            driver.get(url)
+        except TimeoutException:
+            self.failure("timeout")
+            raise
+        self.observe(time.perf_counter() - started)
+
+    def pause(self):
+        """Sleep the current delay between actions (nothing once the site has proven fast)"""
+        if self.delay > 0:
+            time.sleep(self.delay)
+
+    def backoff(self, attempt):
+        """Seconds to sleep before retry number attempt (2 for the first retry), with jitter"""
+        base = max(self.delay, MIN_BACKOFF) * 2 ** (attempt - 2)
+        return min(MAX_DELAY, base) * random.uniform(0.5, 1.0)
+
+    def attempts(self, max_attempts=None):
+        """Yield attempt numbers 1..max_attempts, backing off before each retry"""
+        for attempt in range(1, (max_attempts or self.max_attempts) + 1):
+            if attempt > 1:
+                time.sleep(self.backoff(attempt))
+            yield attempt
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the current concurrency's page-load slots"""
+        with self.lock:
+            while self.active >= self.concurrency:
+                self.lock.wait()
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.lock.notify_all()
+
+    def state(self):
+        with self.lock:
+            return {
+                "timeout": round(self.timeout, 2),
+                "delay": round(self.delay, 2),
+                "concurrency": self.concurrency,
+                "latency": None if self.latency is None else round(self.latency, 3),
+                "failures": self.failures,
+            }
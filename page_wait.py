@@ -0,0 +1,114 @@
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+import time
+import logs
+
+log = logs.get_logger("page_wait")
+
+# Seconds each completed page transition took, in order
+transition_times = []
+
+OBSERVE_SCRIPT = """
+const target = arguments[0];
+if (window.__scraperObserver) {
+    window.__scraperObserver.disconnect();
+}
+window.__scraperLastMutation = 0;
+window.__scraperObserver = new MutationObserver(() => {
+    window.__scraperLastMutation = performance.now();
+});
+window.__scraperObserver.observe(target, {childList: true, subtree: true, characterData: true});
+return arguments[1] ? arguments[1].textContent : null;
+"""
+
+# True once the old container is detached, or the old first row is gone or
+# changed and the DOM under the container has then been quiet for `settle` ms.
+# A spinner or re-rendered pager alone never counts as the new page.
+SETTLED_SCRIPT = """
+const [old, row, text, settle] = arguments;
+if (!old.isConnected) {
+    return true;
+}
+if (row && row.isConnected && row.textContent === text) {
+    return false;
+}
+const last = window.__scraperLastMutation;
+return last > 0 && performance.now() - last >= settle;
+"""
+
+
+class PageTransition:
+    """Wait for a click-driven page change instead of sleeping a fixed time
+
+    Arm it around the click that triggers navigation:
+
+        with PageTransition(driver, (By.ID, 'q-app'), (By.CLASS_NAME, 'q-ml-sm')):
+            driver.execute_script("arguments[0].click();", next_button)
+
+    On exit it blocks until the old container goes stale (full navigation) or,
+    for a client-side render, the first ready_locator row seen before the
+    click is replaced or changes and the subtree stops mutating; then until
+    ready_locator is present again. Raises TimeoutException if that takes over `timeout`.
+    With a pacing.Pacer the timeout is the pacer's, and the transition time
+    (or the timeout) is reported to it.
+    """
+
+    def __init__(self, driver, container_locator, ready_locator=None, timeout=10, settle=0.25, poll=0.05, pacer=None):
+        self.driver = driver
+        self.container_locator = container_locator
+        self.ready_locator = ready_locator or container_locator
+        self.timeout = pacer.timeout if pacer else timeout
+        self.pacer = pacer
+        self.settle = settle
+        self.poll = poll
+        self.elapsed = None
+        self._container = None
+        self._first_row = None
+        self._first_text = None
+        self._started = None
+
+    def __enter__(self):
+        self._container = WebDriverWait(self.driver, self.timeout).until(
+            EC.presence_of_element_located(self.container_locator)
+        )
+        rows = self.driver.find_elements(*self.ready_locator)
+        self._first_row = rows[0] if rows else None
+        self._first_text = self.driver.execute_script(OBSERVE_SCRIPT, self._container, self._first_row)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.wait()
+        return False
+
+    def _settled(self, driver):
+        try:
+            return driver.execute_script(SETTLED_SCRIPT, self._container, self._first_row, self._first_text,
+                                         self.settle * 1000)
+        except StaleElementReferenceException:
+            return True
+
+    def wait(self):
+        """Block until the new page is ready and record how long it took"""
+        remaining = max(self.timeout - (time.perf_counter() - self._started), 0)
+        wait = WebDriverWait(self.driver, remaining, poll_frequency=self.poll)
+        try:
+            wait.until(self._settled)
+            wait.until(EC.presence_of_element_located(self.ready_locator))
+        except TimeoutException:
+            if self.pacer:
+                self.pacer.failure("timeout")
+            raise
+
+        self.elapsed = time.perf_counter() - self._started
+        transition_times.append(self.elapsed)
+        if self.pacer:
+            self.pacer.observe(self.elapsed)
+        # Leased daemon sessions count clicked-through pages toward their recycle budget
+        note_page = getattr(self.driver, "note_page", None)
+        if note_page:
+            note_page()
+        log.info("Page transition took %.2fs", self.elapsed)
+        return self.elapsed
@@ -0,0 +1,103 @@
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+import time
+import driver_factory
+import logs
+import metrics
+from page_wait import transition_times
+
+log = logs.get_logger("prefetch")
+
+
+class TabPrefetcher:
+    """Render page N+1 in a background tab while page N is extracted
+
+    page_url_template is the site's paginated URL with a {page} field; with
+    it, prefetch() opens the next page in a second tab and advance() swaps to
+    it once extraction of the current page is done, so the render overlaps
+    the extraction. Without a template (or if the prefetched tab never
+    renders) advance() falls back to go_to_next_page, the scraper's click path.
+    With a pacing.Pacer the render wait uses, and reports timeouts to, it.
+    Prefetch tabs block the same resources as the driver's first tab.
+    """
+
+    def __init__(self, driver, page_url_template, ready_locator, go_to_next_page, timeout=10, pacer=None):
+        self.driver = driver
+        self.page_url_template = page_url_template
+        self.ready_locator = ready_locator
+        self.go_to_next_page = go_to_next_page
+        self.timeout = timeout
+        self.pacer = pacer
+        self.pending = None
+
+    def prefetch(self, page):
+        """Start loading page in a background tab; the current tab stays active"""
+        if not self.page_url_template or self.pending:
+            return
+        url = self.page_url_template.format(page=page)
+        blocked_urls = getattr(self.driver, "blocked_urls", None)
+        before = set(self.driver.window_handles)
+        # window.open returns as soon as the load starts, unlike driver.get
+        self.driver.execute_script("window.open(arguments[0], '_blank');", "about:blank" if blocked_urls else url)
+        opened = set(self.driver.window_handles) - before
+        if not opened:
+            log.warning("Could not open a prefetch tab for page %s", page)
+            return
+        handle = opened.pop()
+        if blocked_urls:
+            # Setting location returns once the load starts, so the page still renders in the background
+            current = self.driver.current_window_handle
+            self.driver.switch_to.window(handle)
+            driver_factory.block_heavy_resources(self.driver, blocked_urls)
+            self.driver.execute_script("window.location.href = arguments[0];", url)
+            self.driver.switch_to.window(current)
+        self.pending = (page, handle)
+
+    @metrics.timed("advance_page")
+    def advance(self, page):
+        """Make page the active tab, preferring the prefetched one; False if navigation failed"""
+        if not self.pending or self.pending[0] != page:
+            self.discard()
+            return self.go_to_next_page(self.driver)
+
+        handle = self.pending[1]
+        self.pending = None
+        current = self.driver.current_window_handle
+        started = time.perf_counter()
+        self.driver.switch_to.window(handle)
+        try:
+            if self.pacer:
+                self.pacer.until(self.driver, EC.presence_of_element_located(self.ready_locator))
+            else:
+                WebDriverWait(self.driver, self.timeout).until(EC.presence_of_element_located(self.ready_locator))
+        except Exception as e:
+            log.warning("Prefetched page %s did not render (%s), clicking through instead", page, e)
+            self.driver.close()
+            self.driver.switch_to.window(current)
+            return self.go_to_next_page(self.driver)
+
+        # Only the render time left over after extraction is spent waiting here
+        elapsed = time.perf_counter() - started
+        transition_times.append(elapsed)
+        log.info("Swapped to prefetched page %s after %.2fs", page, elapsed)
+        self.driver.switch_to.window(current)
+        self.driver.close()
+        self.driver.switch_to.window(handle)
+        note_page = getattr(self.driver, "note_page", None)
+        if note_page:
+            note_page()
+        return True
+
+    def discard(self):
+        """Close a prefetched tab that will not be used"""
+        if not self.pending:
+            return
+        handle = self.pending[1]
+        self.pending = None
+        try:
+            current = self.driver.current_window_handle
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+            self.driver.switch_to.window(current)
+        except Exception as e:
+            log.warning("Error closing prefetch tab: %s", e)
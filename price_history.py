@@ -0,0 +1,224 @@
+import argparse
+import json
+from datetime import date
+import psycopg2
+from psycopg2 import sql
+import db
+import logs
+from bulk_sink import CopySink
+
+log = logs.get_logger("price_history")
+
+# One row per observed price of a listing, valid from valid_from until the next
+# change (valid_to NULL while current). Partitioned by month of scraped_at so
+# old months can be detached or dropped without touching the rest; BRIN keeps
+# the time indexes tiny since rows arrive in scraped_at order.
+db.register_table("price_history", """
+    CREATE TABLE IF NOT EXISTS price_history (
+        source TEXT NOT NULL,
+        listing_key TEXT NOT NULL,
+        listing JSONB NOT NULL,
+        price TEXT,
+        price_amount NUMERIC(14, 2),
+        price_currency VARCHAR(3),
+        valid_from TIMESTAMP NOT NULL,
+        valid_to TIMESTAMP,
+        scraped_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    ) PARTITION BY RANGE (scraped_at)
+""", [
+    "CREATE INDEX IF NOT EXISTS price_history_scraped_at_brin ON price_history USING BRIN (scraped_at)",
+    "CREATE INDEX IF NOT EXISTS price_history_valid_from_brin ON price_history USING BRIN (valid_from)",
+    "CREATE INDEX IF NOT EXISTS price_history_listing_idx ON price_history (source, listing_key)",
+])
+
+# The open observation of every listing, so change detection never scans history
+db.register_table("price_current", """
+    CREATE TABLE IF NOT EXISTS price_current (
+        source TEXT NOT NULL,
+        listing_key TEXT NOT NULL,
+        price TEXT,
+        scraped_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (source, listing_key)
+    )
+""")
+
+HISTORY_COLUMNS = ('source', 'listing_key', 'listing', 'price', 'price_amount', 'price_currency')
+
+STAGE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS price_history_stage (
+        source TEXT, listing_key TEXT, listing JSONB, price TEXT,
+        price_amount NUMERIC(14, 2), price_currency VARCHAR(3)
+    ) ON COMMIT DELETE ROWS
+"""
+
+# Keep only the last observation of a listing within the batch
+LATEST_ONLY_SQL = """
+    DELETE FROM price_history_stage s USING price_history_stage t
+    WHERE s.source = t.source AND s.listing_key = t.listing_key AND s.ctid < t.ctid
+"""
+
+UNCHANGED_SQL = """
+    DELETE FROM price_history_stage s USING price_current c
+    WHERE c.source = s.source AND c.listing_key = s.listing_key AND c.price IS NOT DISTINCT FROM s.price
+"""
+
+# c.scraped_at is the open row's partition key, so only its partition is touched
+CLOSE_SQL = """
+    UPDATE price_history h SET valid_to = LOCALTIMESTAMP
+    FROM price_current c JOIN price_history_stage s ON c.source = s.source AND c.listing_key = s.listing_key
+    WHERE h.source = c.source AND h.listing_key = c.listing_key AND h.scraped_at = c.scraped_at
+      AND h.valid_to IS NULL
+"""
+
+INSERT_SQL = """
+    INSERT INTO price_history (source, listing_key, listing, price, price_amount, price_currency, valid_from, scraped_at)
+    SELECT source, listing_key, listing, price, price_amount, price_currency, LOCALTIMESTAMP, LOCALTIMESTAMP
+    FROM price_history_stage
+"""
+
+CURRENT_SQL = """
+    INSERT INTO price_current (source, listing_key, price, scraped_at)
+    SELECT source, listing_key, price, LOCALTIMESTAMP FROM price_history_stage
+    ON CONFLICT (source, listing_key) DO UPDATE
+    SET price = EXCLUDED.price, scraped_at = EXCLUDED.scraped_at
+"""
+
+PARTITIONS_SQL = """
+    SELECT child.relname FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = 'price_history'
+    ORDER BY child.relname
+"""
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"price_history_{month:%Y%m}"
+
+
+class PriceHistorySink(CopySink):
+    """Record a listing only when its price differs from its last observation
+
+    Takes the same rows a scraper hands its CopySink (source table columns,
+    including the normalized price columns) and keys each listing by
+    key_columns. Every flush stages the batch, drops listings whose price is
+    unchanged, closes the open row of the ones that changed (valid_to) and
+    inserts their new price, all in one transaction with any checkpoints.
+    """
+
+    def __init__(self, conn, source, columns, key_columns, price_column, max_rows=1000, max_age=5.0):
+        super().__init__(conn, "price_history", HISTORY_COLUMNS, max_rows, max_age)
+        self.source = source
+        self.source_columns = list(columns)
+        self.key_columns = list(key_columns)
+        self.price_column = price_column
+        self.partitions = set()
+        self.copy_sql = sql.SQL("COPY price_history_stage ({}) FROM STDIN WITH (FORMAT csv)").format(
+            sql.SQL(', ').join(map(sql.Identifier, HISTORY_COLUMNS))
+        )
+
+    def add_many(self, rows):
+        observations = []
+        for row in rows:
+            values = dict(zip(self.source_columns, row))
+            listing = {column: values[column] for column in self.key_columns}
+            observations.append((
+                self.source,
+                db.fingerprint(listing.values()),
+                json.dumps(listing, ensure_ascii=False),
+                values[self.price_column],
+                values.get('price_amount'),
+                values.get('price_currency'),
+            ))
+        super().add_many(observations)
+
+    def ensure_partition(self, cursor):
+        """Create this month's partition (by the database clock) if it is missing"""
+        cursor.execute("SELECT date_trunc('month', LOCALTIMESTAMP)::date")
+        month = cursor.fetchone()[0]
+        if month in self.partitions:
+            return
+        cursor.execute(
+            sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF price_history FOR VALUES FROM (%s) TO (%s)").format(
+                sql.Identifier(partition_name(month))
+            ),
+            (month, next_month(month))
+        )
+        self.partitions.add(month)
+
+    def flush(self):
+        with self.lock:
+            try:
+                return super().flush()
+            except Exception:
+                # A rolled-back flush may have "created" a partition that does not exist
+                self.partitions.clear()
+                raise
+
+    def write_rows(self, cursor, buffer, count):
+        self.ensure_partition(cursor)
+        cursor.execute(STAGE_SQL)
+        cursor.copy_expert(self.copy_sql, buffer)
+        for statement in (LATEST_ONLY_SQL, UNCHANGED_SQL, CLOSE_SQL):
+            cursor.execute(statement)
+        cursor.execute(INSERT_SQL)
+        inserted = cursor.rowcount
+        cursor.execute(CURRENT_SQL)
+        log.debug("%s of %s %s prices changed", inserted, count, self.source)
+        return inserted
+
+
+def retire_partitions(conn, keep_months, drop=False):
+    """Detach (or drop) monthly partitions older than keep_months, returning their names
+
+    A partition still holding a listing's open row (valid_to NULL, what
+    price_current points at) stays attached until that listing's price changes.
+    """
+    today = date.today()
+    months = today.year * 12 + today.month - 1 - keep_months
+    cutoff = partition_name(date(months // 12, months % 12 + 1, 1))
+
+    retired = []
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(PARTITIONS_SQL)
+            for (name,) in cursor.fetchall():
+                if name >= cutoff:
+                    continue
+                cursor.execute(
+                    sql.SQL("SELECT EXISTS (SELECT 1 FROM {} WHERE valid_to IS NULL)").format(sql.Identifier(name))
+                )
+                if cursor.fetchone()[0]:
+                    log.info("Keeping %s attached: it holds current prices", name)
+                    continue
+                cursor.execute(sql.SQL("ALTER TABLE price_history DETACH PARTITION {}").format(sql.Identifier(name)))
+                if drop:
+                    cursor.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+                retired.append(name)
+        conn.commit()
+    except psycopg2.Error as e:
+        log.error("Error retiring price history partitions: %s", e)
+        conn.rollback()
+        return []
+    log.info("%s %s partitions older than %s", "Dropped" if drop else "Detached", len(retired), cutoff)
+    return retired
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detach or drop old price_history partitions")
+    parser.add_argument("--keep-months", type=int, default=12, help="months of history to keep attached")
+    parser.add_argument("--drop", action="store_true", help="drop the detached partitions instead of keeping them")
+    args = parser.parse_args()
+
+    with db.connection() as conn:
+        db.ensure_schema(conn, "price_history", "price_current")
+        retire_partitions(conn, args.keep_months, args.drop)
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+from collections import namedtuple
+import time
+import db
+import metrics
+
+# Rows as each site yields them, in the column order of their tables. Being
+# tuples they need no per-instance dict and go straight into db.new_rows and
+# the sinks.
+
+# Rows per known-fingerprint lookup when streaming records into a sink
+STREAM_BATCH = 50
+
+# scraper1 -> account_listings
+Listing = namedtuple("Listing", "account_name seller_name price")
+
+# scraper2 -> seller_listings
+SellerListing = namedtuple("SellerListing", "seller_name price")
+
+# scraper3 -> seller_data
+Offer = namedtuple("Offer", "game_name server price")
+
+# scraper4 -> feedback
+Feedback = namedtuple("Feedback", "feedback_rating comment date left_by")
+
+
+def batches(records, size=STREAM_BATCH):
+    """Group a stream of records into lists of up to size, yielding each as soon as it fills"""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_into(table, records, write, check_stored=True, phase=None):
+    """Pass records batch by batch through db.new_rows to write, returning (seen, new, last record)
+
+    Only one batch is held at a time, so writing starts before the page is
+    fully extracted and memory stays flat however many records go by. With
+    phase, the time spent checking and writing batches is recorded under it
+    with the new row count; the time records takes to produce them is left
+    to the extraction's own phase.
+    """
+    seen = new = 0
+    last = None
+    elapsed = 0.0
+    try:
+        for batch in batches(records):
+            started = time.perf_counter()
+            rows = db.new_rows(table, batch, check_stored)
+            if rows:
+                write(rows)
+            elapsed += time.perf_counter() - started
+            seen += len(batch)
+            new += len(rows)
+            last = batch[-1]
+    finally:
+        if phase:
+            metrics.registry.observe(phase, elapsed, new)
+    return seen, new, last
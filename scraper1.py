@@ -1,52 +1,91 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import time
-import psycopg2
-
-# Database configuration
-DB_HOST = "host"
-DB_NAME = "database name"
-DB_USER = "postgres"
-DB_PASSWORD = "password"
-DB_PORT = "5432"
-
-def create_table(conn):
-    """Create the table if it doesn't exist"""
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS 'table name' (
-                    id SERIAL PRIMARY KEY,
-                    account_name TEXT NOT NULL,
-                    seller_name TEXT NOT NULL,
-                    price_in_USD TEXT NOT NULL,
-                    scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-        conn.commit()
-    except psycopg2.Error as e:
-        print(f"Error creating table: {e}")
-        conn.rollback()
-
-def save_to_db(conn, data):
-    """Save scraped data to PostgreSQL"""
-    try:
-        with conn.cursor() as cursor:
-            cursor.executemany(
-                "INSERT INTO 'table name' (account_name, seller_name, price_in_USD) VALUES (%s, %s, %s)",
-                data
-            )
-        conn.commit()
-    except psycopg2.Error as e:
-        print(f"Error inserting data: {e}")
-        conn.rollback()
-
-
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+import argparse
+import db
+import checkpoints
+import logs
+import metrics
+import driver_factory
+import command_trace
+import file_sink
+import normalize
+import html_archive
+import api_fetch
+import pacing
+import records
+from records import Listing
+from db_writer import WriterError
+from lxml import html as lxml_html
+from page_wait import PageTransition
+from prefetch import TabPrefetcher
+
+log = logs.get_logger("scraper1")
+
+pacer = pacing.Pacer("scraper1")
+
+START_URL = 'url/link of the website where you get the data'
+# Set to the listing's paginated URL (e.g. "url/link ?page={page}") to render the
+# next page in a background tab while the current one is extracted
+PAGE_URL_TEMPLATE = None
+# The JSON endpoint the listing is rendered from (e.g. "url/api/listings?page={page}"),
+# for --fetch api; API_FIELDS are the item keys that map, in order, onto a Listing
+API_URL_TEMPLATE = None
+API_FIELDS = ('account', 'seller', 'price')
+TABLE_NAME = "account_listings"
+COLUMNS = ('account_name', 'seller_name', 'price_in_usd', 'row_hash') + normalize.PRICE_COLUMNS
+
+# Pull every row in one execute_script call instead of ~6 WebDriver calls per row
+BATCHED_EXTRACTION = True
+
+# Stop paginating at the first page whose rows are all already stored (--incremental/--no-incremental)
+INCREMENTAL = True
+
+# What --price-history tracks: the columns identifying a listing, and its price column
+PRICE_HISTORY_KEY = (('account_name', 'seller_name'), 'price_in_usd')
+
+LIST_CONTAINER_XPATH = '//*[@id="q-app"]/div/div[1]/main/div/div[5]/div[1]/div[2]/div/div[2]/div'
+LIST_XPATH = f'{LIST_CONTAINER_XPATH}/div'
+
+# Row-relative XPaths, evaluated in the browser against each list item
+ROWS_SCRIPT = """
+const rows = document.evaluate(arguments[0], document, null,
+    XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const fields = arguments[1];
+const out = [];
+for (let i = 0; i < rows.snapshotLength; i++) {
+    const row = rows.snapshotItem(i);
+    const values = [];
+    for (const path of fields) {
+        const node = document.evaluate(path, row, null,
+            XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        if (!node) {
+            return out;
+        }
+        values.push(node.innerText.trim());
+    }
+    out.push(values);
+}
+return out;
+"""
+ROW_FIELD_XPATHS = [
+    'div/a/div[1]/div/span',
+    'div/div/a[1]/div/div[2]/div[1]',
+    'div/div/a[2]/span[1]',
+]
+
+def save_to_db(sink, listings, check_stored=True):
+    """Stream listings not already stored to the background writer, returning (seen, new, last listing)"""
+    # The column is USD-denominated, so bare amounts are dollars
+    return records.stream_into(TABLE_NAME, listings,
+                               lambda rows: sink.add_many(normalize.with_prices(rows, 2, default_currency='USD')),
+                               check_stored, phase="save_to_db")
+
+
+@metrics.timed("scrape_data")
 def scrape_data(driver):
-    wait = WebDriverWait(driver, 10)
-    scraped_items = []
+    # A missing row ends the list, so these waits do not count as failures
+    wait = pacer.wait(driver)
 
     for i in range(1, 100):
         try:
@@ -62,91 +101,179 @@ def scrape_data(driver):
             seller_name = seller_element.text.strip()
             price = price_element.text.strip()
 
-            print(f"{i}: {account_name} || {seller_name} || {price}")
-            scraped_items.append((account_name, seller_name, price))
+            log.debug("%s: %s || %s || %s", i, account_name, seller_name, price,
+                  extra={"row": i, "account_name": account_name, "seller_name": seller_name, "price": price})
 
-        except Exception as e:
-            print(f"{i}: Element not found or error: {e}")
-            break  
+        except (TimeoutException, NoSuchElementException) as e:
+            log.info("%s: Element not found: %s", i, e)
+            break
+        except WebDriverException as e:
+            raise checkpoints.NavigationError(f"Error reading row {i}: {e}") from e
 
-    return scraped_items
+        yield Listing(account_name, seller_name, price)
 
 
+@metrics.timed("scrape_data_batched")
+def scrape_data_batched(driver):
+    """Extract every row on the page with a single execute_script round trip"""
+    try:
+        pacer.until(driver, EC.presence_of_element_located((By.XPATH, f'{LIST_XPATH}[1]/{ROW_FIELD_XPATHS[0]}')))
+    except TimeoutException:
+        log.info("No rows on this page")
+        return
+    try:
+        rows = driver.execute_script(ROWS_SCRIPT, LIST_XPATH, ROW_FIELD_XPATHS)
+    except WebDriverException as e:
+        raise checkpoints.NavigationError(f"Error extracting rows: {e}") from e
+
+    for i, (account_name, seller_name, price) in enumerate(rows, start=1):
+        log.debug("%s: %s || %s || %s", i, account_name, seller_name, price,
+                  extra={"row": i, "account_name": account_name, "seller_name": seller_name, "price": price})
+        yield Listing(account_name, seller_name, price)
+
+
+@metrics.timed("parse_page_source")
+def parse_page_source(page_source):
+    """Extract rows from a page_source snapshot without the browser, as scrape_data_batched does live"""
+    tree = lxml_html.fromstring(page_source)
+    for row in tree.xpath(LIST_XPATH):
+        values = []
+        for path in ROW_FIELD_XPATHS:
+            nodes = row.xpath(path)
+            if not nodes:
+                return
+            values.append(nodes[0].text_content().strip())
+        yield Listing(*values)
+
+
+@metrics.timed("go_to_next_page")
 def go_to_next_page(driver):
+    """Click Next; False when there is no next page, NavigationError if the page change failed"""
     try:
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2)
 
-        pagination = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CLASS_NAME, 'q-pagination'))
-        )
+        try:
+            pagination = pacer.until(driver, EC.presence_of_element_located((By.CLASS_NAME, 'q-pagination')),
+                                     observe=False)
+        except TimeoutException:
+            log.info("No pagination on this page")
+            return False
 
         buttons = pagination.find_elements(By.CLASS_NAME, 'q-btn')
         if not buttons or len(buttons) < 2:
-            print("Next button not found")
+            log.warning("Next button not found")
             return False
 
         next_button = buttons[-1]
         icon = next_button.find_element(By.TAG_NAME, 'i')
 
         if icon.get_attribute("innerHTML").strip() != "keyboard_arrow_right":
-            print("Last button is not the next page button.")
+            log.warning("Last button is not the next page button.")
             return False
 
-        driver.execute_script("arguments[0].click();", next_button)
-        time.sleep(5)
+        with PageTransition(driver, (By.XPATH, LIST_CONTAINER_XPATH), (By.XPATH, f'{LIST_XPATH}[1]'), pacer=pacer):
+            driver.execute_script("arguments[0].click();", next_button)
         return True
 
-    except Exception as e:
-        print(f"Error navigating to next page: {e}")
-        return False
+    except WebDriverException as e:
+        raise checkpoints.NavigationError(f"Error navigating to next page: {e}") from e
 
 
 def main():
-
-    # Connect to database
-    try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
-        )
-    except psycopg2.Error as e:
-        print(f"Database connection error: {e}")
+    parser = argparse.ArgumentParser()
+    file_sink.add_crawl_arguments(parser, INCREMENTAL, price_history=True)
+    file_sink.add_arguments(parser)
+    html_archive.add_arguments(parser)
+    parser.add_argument("--fetch", choices=["browser", "api"], default="browser",
+                        help="render pages in Chrome, or read API_URL_TEMPLATE's JSON directly (falls back to Chrome)")
+    args = parser.parse_args()
+    if args.fetch == "api" and not API_URL_TEMPLATE:
+        parser.error("--fetch api needs API_URL_TEMPLATE set to the listing's JSON endpoint")
+    sink, conn = file_sink.create_sink(parser, args, TABLE_NAME, COLUMNS, PRICE_HISTORY_KEY)
+    if sink is None:
         return
+    to_db = args.output == "postgres"
+    archive = html_archive.create('scraper1', args.archive_dir) if args.record else None
 
-    create_table(conn)
-
+    driver = None
     try:
-        driver = webdriver.Chrome()
-        driver.get('url/link of the website where you get the data')
-
         page_number = 1
         max_pages = 2
 
-        while page_number <= max_pages:
-            print(f"\n--- Scraping Page {page_number} ---")
-            items = scrape_data(driver)
+        if args.fetch == "api":
+            # Chrome only starts if the API fails; then it picks up at the page that failed
+            with api_fetch.ListingApi(API_URL_TEMPLATE, Listing, API_FIELDS, pacer=pacer) as api:
+                page_number = api.save_pages(save_to_db, sink, 'scraper1', START_URL, max_pages,
+                                             to_db and not args.price_history, args.incremental, args.resume)
+            if page_number is None:
+                return
+
+        driver = driver_factory.create_driver()
+        pacer.load(driver, START_URL)
+
+        if page_number > 1:
+            if not checkpoints.skip_pages(driver, page_number - 1, go_to_next_page):
+                log.error("Failed to go to next page.")
+                return
+        elif args.resume:
+            page_number = checkpoints.fast_forward(driver, 'scraper1', START_URL, go_to_next_page)
+            if page_number is None:
+                log.error("Failed to go to next page.")
+                return
+
+        prefetcher = TabPrefetcher(driver, PAGE_URL_TEMPLATE, (By.XPATH, f'{LIST_XPATH}[1]'), go_to_next_page,
+                                   pacer=pacer)
 
-            if items:
-                save_to_db(conn, items)
+        while page_number <= max_pages:
+            metrics.set_page(page_number)
+            log.info("Scraping Page %s", page_number, extra={"page": page_number})
+            if page_number < max_pages:
+                prefetcher.prefetch(page_number + 1)
+            if archive:
+                archive.record_page(driver, page_number)
+            if BATCHED_EXTRACTION:
+                listings = scrape_data_batched(driver)
             else:
-                print("No items found on this page.")
+                listings = scrape_data(driver)
+
+            seen, new_count, last = save_to_db(sink, listings, to_db and not args.price_history)
+            if not seen:
+                log.info("No items found on this page.")
+                break
+
+            sink.checkpoint('scraper1', START_URL, page_number, seen)
+            log.info("Page %s: %s rows, %s new, last %s", page_number, seen, new_count, last.account_name,
+                     extra={"page": page_number, "rows": seen, "new_rows": new_count})
+            if args.incremental and new_count == 0:
+                log.info("Only already-stored rows on this page, stopping.")
                 break
 
             page_number += 1
 
             if page_number <= max_pages:
-                next_success = go_to_next_page(driver)
+                next_success = prefetcher.advance(page_number)
                 if not next_success:
-                    print("Failed to go to next page.")
+                    log.info("Reached the last page.")
                     break
 
+        checkpoints.finish(sink, 'scraper1', START_URL)
+
+    except (checkpoints.NavigationError, WebDriverException) as e:
+        log.error("Stopped before the end of the listing, keeping the checkpoint: %s", e)
     finally:
-        driver.quit()
-        conn.close()
+        if driver is not None:
+            driver.quit()
+        try:
+            sink.close()
+        except WriterError as e:
+            log.error("Error writing data: %s", e)
+        if conn is not None:
+            db.put_conn(conn)
+        db.close_pool()
+        if archive:
+            archive.close()
+        metrics.write_reports('scraper1')
+        command_trace.check_all()
 
 
 if __name__ == "__main__":
@@ -1,147 +1,251 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import time
-import psycopg2
-
-
-# Database configuration
-DB_HOST = "localhost"
-DB_NAME = "data_scrap"
-DB_USER = "postgres"
-DB_PASSWORD = "password"
-DB_PORT = "5432"
-
-
-def create_table(conn):
-    """Create the table if it doesn't exist"""
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS 'table name' (
-                    id SERIAL PRIMARY KEY,
-                    seller_name TEXT NOT NULL,
-                    price TEXT NOT NULL,
-                    scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-        conn.commit()
-    except psycopg2.Error as e:
-        print(f"Error creating table: {e}")
-        conn.rollback()
-
-
-def save_to_db(conn, data):
-    """Save scraped data to PostgreSQL"""
-    try:
-        with conn.cursor() as cursor:
-            cursor.executemany(
-                "INSERT INTO 'table name' (seller_name, price) VALUES (%s, %s)",
-                data
-            )
-        conn.commit()
-    except psycopg2.Error as e:
-        print(f"Error inserting data: {e}")
-        conn.rollback()
-
-
+from selenium.common.exceptions import TimeoutException, WebDriverException
+import argparse
+import db
+import checkpoints
+import logs
+import metrics
+import driver_factory
+import command_trace
+import file_sink
+import normalize
+import html_archive
+import api_fetch
+import pacing
+import records
+from records import SellerListing
+from db_writer import WriterError
+from lxml import html as lxml_html
+from lxml.cssselect import CSSSelector
+from page_wait import PageTransition
+from prefetch import TabPrefetcher
+
+log = logs.get_logger("scraper2")
+
+pacer = pacing.Pacer("scraper2")
+
+START_URL = "url/ website link"
+# Set to the listing's paginated URL (e.g. "url/ website link?page={page}") to render
+# the next page in a background tab while the current one is extracted
+PAGE_URL_TEMPLATE = None
+# The JSON endpoint the listing is rendered from (e.g. "url/api/listings?page={page}"),
+# for --fetch api; API_FIELDS are the item keys that map, in order, onto a SellerListing
+API_URL_TEMPLATE = None
+API_FIELDS = ('seller', 'price')
+TABLE_NAME = "seller_listings"
+COLUMNS = ('seller_name', 'price', 'row_hash') + normalize.PRICE_COLUMNS
+
+# Parse one page_source snapshot per page instead of reading live elements
+SNAPSHOT_PARSING = True
+
+# Stop paginating at the first page whose rows are all already stored (--incremental/--no-incremental)
+INCREMENTAL = True
+
+# No --price-history: a seller lists several offers and nothing on the page tells
+# them apart, so a seller_name key would flip one price record between them
+
+SELLER_SELECTOR = CSSSelector('.q-ml-sm')
+PRICE_SELECTOR = CSSSelector('.text-body1, .text-subtitle2')
+PRICE_LABELS = ('Unit price', 'Buy now')
+
+
+def save_to_db(sink, listings, check_stored=True):
+    """Stream listings not already stored to the background writer, returning (seen, new, last listing)"""
+    return records.stream_into(TABLE_NAME, listings, lambda rows: sink.add_many(normalize.with_prices(rows, 1)),
+                               check_stored, phase="save_to_db")
+
+
+@metrics.timed("scrape")
 def scrape(driver):
-    results = []
     try:
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.CLASS_NAME, 'q-ml-sm'))
-        )
-
+        pacer.until(driver, EC.presence_of_all_elements_located((By.CLASS_NAME, 'q-ml-sm')))
+    except TimeoutException:
+        log.info("No sellers on this page")
+        return
+    try:
         sellers = driver.find_elements(By.CLASS_NAME, 'q-ml-sm')
         prices = driver.find_elements(By.CSS_SELECTOR, '.text-body1, .text-subtitle2')
 
         for i in range(min(len(sellers), len(prices))):
             seller = sellers[i].text.strip()
             price = prices[i].text.strip()
-            if price in ('Unit price', 'Buy now'):
+            if price in PRICE_LABELS:
                 continue
-            print(f'Seller and Level: {seller}, Price: {price}')
-            results.append((seller, price))
-
-    except Exception as e:
-        print(f'Error during scraping: {e}')
-    return results
+            log.debug("Seller and Level: %s, Price: %s", seller, price, extra={"seller_name": seller, "price": price})
+            yield SellerListing(seller, price)
+
+    except WebDriverException as e:
+        raise checkpoints.NavigationError(f"Error during scraping: {e}") from e
+
+
+def find_card_price(seller):
+    """Return the price sharing the seller's card container, or None"""
+    node = seller.getparent()
+    while node is not None:
+        prices = [p for p in PRICE_SELECTOR(node) if p.text_content().strip() not in PRICE_LABELS]
+        if prices:
+            # The first ancestor holding a price must belong to this seller alone
+            if len(SELLER_SELECTOR(node)) > 1:
+                return None
+            return prices[0].text_content().strip()
+        node = node.getparent()
+    return None
+
+
+@metrics.timed("parse_page_source")
+def parse_page_source(page_source):
+    """Extract (seller, price) pairs from a page_source snapshot without the browser"""
+    tree = lxml_html.fromstring(page_source)
+    for seller_element in SELLER_SELECTOR(tree):
+        price = find_card_price(seller_element)
+        if price is None:
+            continue
+        seller = seller_element.text_content().strip()
+        log.debug("Seller and Level: %s, Price: %s", seller, price, extra={"seller_name": seller, "price": price})
+        yield SellerListing(seller, price)
+
+
+@metrics.timed("scrape_snapshot")
+def scrape_snapshot(driver):
+    """Grab page_source once and parse it offline"""
+    try:
+        pacer.until(driver, EC.presence_of_all_elements_located((By.CLASS_NAME, 'q-ml-sm')))
+    except TimeoutException:
+        log.info("No sellers on this page")
+        return
+    try:
+        page_source = driver.page_source
+    except WebDriverException as e:
+        raise checkpoints.NavigationError(f"Error during scraping: {e}") from e
+    yield from parse_page_source(page_source)
 
 
+@metrics.timed("go_to_next_page")
 def go_to_next_page(driver):
+    """Click Next; False when there is no next page, NavigationError if the page change failed"""
     try:
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(2)
 
-        pagination = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CLASS_NAME, 'q-pagination'))
-        )
+        try:
+            pagination = pacer.until(driver, EC.presence_of_element_located((By.CLASS_NAME, 'q-pagination')),
+                                     observe=False)
+        except TimeoutException:
+            log.info("No pagination on this page")
+            return False
 
         buttons = pagination.find_elements(By.CLASS_NAME, 'q-btn')
         if not buttons or len(buttons) < 2:
-            print("Next button not found")
+            log.warning("Next button not found")
             return False
 
         next_button = buttons[-1]
 
         icon = next_button.find_element(By.TAG_NAME, 'i')
         if icon.get_attribute("innerHTML").strip() != "keyboard_arrow_right":
-            print("Last button is not the next page button.")
+            log.warning("Last button is not the next page button.")
             return False
 
-        driver.execute_script("arguments[0].click();", next_button)
-        time.sleep(5)
+        with PageTransition(driver, (By.ID, 'q-app'), (By.CLASS_NAME, 'q-ml-sm'), pacer=pacer):
+            driver.execute_script("arguments[0].click();", next_button)
         return True
 
-    except Exception as e:
-        print(f"Error navigating to next page: {e}")
-        return False
+    except WebDriverException as e:
+        raise checkpoints.NavigationError(f"Error navigating to next page: {e}") from e
 
 
 def main():
-    # Connect to database
-    try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
-        )
-    except psycopg2.Error as e:
-        print(f"Database connection error: {e}")
+    parser = argparse.ArgumentParser()
+    file_sink.add_crawl_arguments(parser, INCREMENTAL)
+    file_sink.add_arguments(parser)
+    html_archive.add_arguments(parser)
+    parser.add_argument("--fetch", choices=["browser", "api"], default="browser",
+                        help="render pages in Chrome, or read API_URL_TEMPLATE's JSON directly (falls back to Chrome)")
+    args = parser.parse_args()
+    if args.fetch == "api" and not API_URL_TEMPLATE:
+        parser.error("--fetch api needs API_URL_TEMPLATE set to the listing's JSON endpoint")
+    sink, conn = file_sink.create_sink(parser, args, TABLE_NAME, COLUMNS)
+    if sink is None:
         return
+    to_db = args.output == "postgres"
+    archive = html_archive.create('scraper2', args.archive_dir) if args.record else None
 
-    create_table(conn)
-
+    driver = None
     try:
-        driver = webdriver.Chrome()
-        driver.get("url/ website link")
-        time.sleep(5)
-
         page_number = 1
         max_pages = 5
 
-        while page_number <= max_pages:
-            print(f"\n--- Scraping Page {page_number} ---")
-            items = scrape(driver)
+        if args.fetch == "api":
+            # Chrome only starts if the API fails; then it picks up at the page that failed
+            with api_fetch.ListingApi(API_URL_TEMPLATE, SellerListing, API_FIELDS, pacer=pacer) as api:
+                page_number = api.save_pages(save_to_db, sink, 'scraper2', START_URL, max_pages, to_db,
+                                             args.incremental, args.resume)
+            if page_number is None:
+                return
+
+        driver = driver_factory.create_driver()
+        pacer.load(driver, START_URL)
+
+        if page_number > 1:
+            if not checkpoints.skip_pages(driver, page_number - 1, go_to_next_page):
+                log.info("Reached last page or couldn't navigate.")
+                return
+        elif args.resume:
+            page_number = checkpoints.fast_forward(driver, 'scraper2', START_URL, go_to_next_page)
+            if page_number is None:
+                log.info("Reached last page or couldn't navigate.")
+                return
+
+        prefetcher = TabPrefetcher(driver, PAGE_URL_TEMPLATE, (By.CLASS_NAME, 'q-ml-sm'), go_to_next_page, pacer=pacer)
 
-            if items:
-                save_to_db(conn, items)
+        while page_number <= max_pages:
+            metrics.set_page(page_number)
+            log.info("Scraping Page %s", page_number, extra={"page": page_number})
+            if page_number < max_pages:
+                prefetcher.prefetch(page_number + 1)
+            if archive:
+                archive.record_page(driver, page_number)
+            if SNAPSHOT_PARSING:
+                listings = scrape_snapshot(driver)
             else:
-                print("No items found on this page.")
+                listings = scrape(driver)
+
+            seen, new_count, last = save_to_db(sink, listings, to_db)
+            if not seen:
+                log.info("No items found on this page.")
                 break
 
-            if not go_to_next_page(driver):
-                print("Reached last page or couldn't navigate.")
+            sink.checkpoint('scraper2', START_URL, page_number, seen)
+            log.info("Page %s: %s rows, %s new, last %s", page_number, seen, new_count, last.seller_name,
+                     extra={"page": page_number, "rows": seen, "new_rows": new_count})
+            if args.incremental and new_count == 0:
+                log.info("Only already-stored rows on this page, stopping.")
+                break
+
+            if not prefetcher.advance(page_number + 1):
+                log.info("Reached the last page.")
                 break
 
             page_number += 1
 
+        checkpoints.finish(sink, 'scraper2', START_URL)
+
+    except (checkpoints.NavigationError, WebDriverException) as e:
+        log.error("Stopped before the end of the listing, keeping the checkpoint: %s", e)
     finally:
-        driver.quit()
-        conn.close()
+        if driver is not None:
+            driver.quit()
+        try:
+            sink.close()
+        except WriterError as e:
+            log.error("Error writing data: %s", e)
+        if conn is not None:
+            db.put_conn(conn)
+        db.close_pool()
+        if archive:
+            archive.close()
+        metrics.write_reports('scraper2')
+        command_trace.check_all()
 
 
 if __name__ == "__main__":
@@ -1,164 +1,367 @@
-import psycopg2
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+import argparse
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from lxml import html as lxml_html
+from lxml.cssselect import CSSSelector
+from page_wait import PageTransition
+import db
+import checkpoints
+import logs
+import metrics
+import driver_factory
+import command_trace
+import file_sink
+import normalize
+import html_archive
+import pacing
+import records
+from records import Offer
+from db_writer import WriterError
 
-# Database configuration
-DB_HOST = "localhost"
-DB_NAME = "data_scrap"
-DB_USER = "postgres"
-DB_PASSWORD = "password"
+log = logs.get_logger("scraper3")
 
-def create_table_if_not_exists(conn):
-    """Create the table if it doesn't exist"""
-    try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS seller_data (
-                id SERIAL PRIMARY KEY,
-                game_name TEXT,
-                server TEXT,
-                price TEXT,
-                scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-    except Exception as e:
-        print(f"Error creating table: {e}")
-        conn.rollback()
+# Waits, page loads, retries and how many workers load pages at once, paced by how the site responds
+pacer = pacing.Pacer("scraper3")
+
+START_URL = "url/ website link "
+TABLE_NAME = "seller_data"
+COLUMNS = ('game_name', 'server', 'price', 'row_hash') + normalize.PRICE_COLUMNS
+
+GAME_SELECTOR = CSSSelector('.offer-title-colum')
+SERVER_SELECTOR = CSSSelector('.offer-title-id')
+PRICE_SELECTOR = CSSSelector('.offer-price-tag.price')
+NEXT_PAGE_SELECTOR = 'a.page-link[aria-label="Next Page"]:not([aria-disabled="true"])'
+# Set to the site's paginated URL (e.g. "url/ website link ?page={page}") to let
+# workers jump straight to their first page instead of clicking through
+PAGE_URL_TEMPLATE = None
+
+# Stop each worker at its first page with no new offers (--incremental/--no-incremental)
+INCREMENTAL = False
+
+# What --price-history tracks: the columns identifying an offer, and its price column
+PRICE_HISTORY_KEY = (('game_name', 'server'), 'price')
+
+# Chrome profiles reused across runs (one per worker): they keep the consent
+# cookie and a warm HTTP cache. Override with --profile-dir, or pass "" to disable
+PROFILE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "web-scraping", "scraper3")
+# Written into a profile once it holds the consent cookie; it records the
+# cookie's expiry, after which the popup is looked for again
+CONSENT_MARKER = "consent-recorded"
+# The cookie the site sets when its consent popup is accepted
+CONSENT_COOKIE_NAME = "cookie_consent"
+# The site's consent cookie as CDP Network.setCookie params, e.g.
+# {"name": "cookie_consent", "value": "1", "url": START_URL}; when set it is
+# seeded before the first page load and the popup is never waited for
+CONSENT_COOKIE = None
+
+# Browser sessions already past the consent popup, and their profile dirs
+_consent_handled = set()
+_profile_dirs = {}
+
+def consent_expiry(driver):
+    """Expiry (epoch seconds) of the consent cookie on the current site, or None if it is missing or session-only"""
+    cookie = driver.get_cookie(CONSENT_COOKIE_NAME)
+    return cookie.get("expiry") if cookie else None
 
-def connect_to_db():
-    """Establish database connection and ensure table exists"""
+def record_consent(driver, expires=None):
+    """Remember that this browser is past the consent popup, and its persistent profile until expires"""
+    _consent_handled.add(driver.session_id)
+    profile_dir = _profile_dirs.get(driver.session_id)
+    if profile_dir and expires:
+        os.makedirs(profile_dir, exist_ok=True)
+        with open(os.path.join(profile_dir, CONSENT_MARKER), "w") as f:
+            f.write(str(int(expires)))
+
+def consent_recorded(profile_dir):
+    """True while profile_dir's consent marker is unexpired; an expired or unreadable marker is removed"""
+    path = os.path.join(profile_dir, CONSENT_MARKER)
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        create_table_if_not_exists(conn)
-        return conn
-    except Exception as e:
-        print(f"Database connection error: {e}")
-        return None
+        with open(path) as f:
+            if int(f.read().strip()) > time.time():
+                return True
+    except FileNotFoundError:
+        return False
+    except ValueError:
+        pass
+    os.remove(path)
+    return False
 
+@metrics.timed("handle_cookie_popup")
 def handle_cookie_popup(driver):
-    """Handle the cookie popup if it appears"""
+    """Handle the cookie popup the first time a browser meets it; later calls return at once"""
+    if driver.session_id in _consent_handled:
+        return
+
+    try:
+        # The popup is often simply absent, so not finding it is no sign of trouble
+        popup = pacer.until(driver, EC.visibility_of_element_located((By.ID, 'isEurope')), timeout=3, observe=False)
+    except TimeoutException:
+        # Only remembered if the profile really holds the consent cookie
+        expires = consent_expiry(driver)
+        if expires:
+            record_consent(driver, expires)
+        return
+
     try:
-        popup = WebDriverWait(driver, 3).until(
-            EC.visibility_of_element_located((By.ID, 'isEurope'))
-        )
         accept_btn = popup.find_element(By.CSS_SELECTOR, '#acceptCookiesButton')
         accept_btn.click()
-        print("Cookie popup closed")
-        time.sleep(1)
-    except (TimeoutException, NoSuchElementException):
-        pass
+        pacer.until(driver, EC.invisibility_of_element_located((By.ID, 'isEurope')), timeout=3)
+    except (TimeoutException, NoSuchElementException) as e:
+        log.warning("Could not accept the cookie popup: %s", e)
+        return
+    log.info("Cookie popup closed")
+    record_consent(driver, consent_expiry(driver))
+
+@metrics.timed("scrape_page")
+def scrape_page(driver, page_num, sink, check_stored=True, checkpoint_key=None):
+    """Scrape the current page into the sink, returning the number of new offers queued
+
+    With checkpoint_key the page's row count is checkpointed behind its rows, as the other scrapers do
+    """
+    log.info("Page %s", page_num, extra={"page": page_num})
 
-def scrape_page(driver, page_num, conn):
-    print(f"\n--- Page {page_num} ---")
-    
     try:
-        games = WebDriverWait(driver, 10).until(
-            EC.visibility_of_all_elements_located((By.CSS_SELECTOR, '.offer-title-colum'))
-        )
-
-        servers = WebDriverWait(driver, 10).until(
-            EC.visibility_of_all_elements_located((By.CLASS_NAME, 'offer-title-id'))
-        )
-
-        prices = WebDriverWait(driver, 10).until(
-            EC.visibility_of_all_elements_located((By.CSS_SELECTOR, '.offer-price-tag.price'))
-        )
-
-        cursor = conn.cursor()
-        inserted_count = 0
-        
-        for i in range(min(len(games), len(servers), len(prices))):
-            try:
-                game_name = games[i].text.strip()
-                server = servers[i].text.strip()
-                price = prices[i].text.strip()
-
-                print(f'Game Name: {game_name}, Server: {server}, Price: {price}')
-
-                cursor.execute(
-                    "INSERT INTO seller_data (game_name, server, price) VALUES (%s, %s, %s)",
-                    (game_name, server, price)
-                )
-                inserted_count += 1
-                
-            except NoSuchElementException as e:
-                print(f"Error extracting data from an offer: {e}")
-                continue
-            except Exception as e:
-                print(f"Database error on record {i}: {e}")
-                conn.rollback()
-                continue
-        
-        conn.commit()
-        print(f"Successfully inserted {inserted_count} records from page {page_num}")
-        
+        seen, new_count, last = save_offers(sink, extract_offers(driver), check_stored)
+    except WriterError:
+        raise
     except Exception as e:
-        print(f"Error scraping page {page_num}: {e}")
-        conn.rollback()
+        log.error("Error scraping page %s: %s", page_num, e)
+        return None
+
+    log.info("Queued %s new of %s records from page %s (last %s)", new_count, seen, page_num,
+             last.game_name if last else None, extra={"page": page_num, "rows": seen, "new_rows": new_count})
+    if checkpoint_key:
+        sink.checkpoint(checkpoint_key, START_URL, page_num, seen)
+    return new_count
+
+@metrics.timed("extract_offers")
+def extract_offers(driver):
+    """Yield the current page's offers as they are read"""
+    games = pacer.until(driver, EC.visibility_of_all_elements_located((By.CSS_SELECTOR, '.offer-title-colum')))
+
+    servers = pacer.until(driver, EC.visibility_of_all_elements_located((By.CLASS_NAME, 'offer-title-id')))
+
+    prices = pacer.until(driver, EC.visibility_of_all_elements_located((By.CSS_SELECTOR, '.offer-price-tag.price')))
+
+    for i in range(min(len(games), len(servers), len(prices))):
+        try:
+            game_name = games[i].text.strip()
+            server = servers[i].text.strip()
+            price = prices[i].text.strip()
+        except NoSuchElementException as e:
+            log.error("Error extracting data from an offer: %s", e)
+            continue
+
+        log.debug("Game Name: %s, Server: %s, Price: %s", game_name, server, price,
+                  extra={"game_name": game_name, "server": server, "price": price})
+        yield Offer(game_name, server, price)
+
+def save_offers(sink, offers, check_stored=True):
+    """Stream offers not already stored to the sink, returning (seen, new, last offer)"""
+    # Shared by all workers; the writer thread does the COPY while this browser moves on
+    return records.stream_into(TABLE_NAME, offers, lambda rows: sink.add_many(normalize.with_prices(rows, 2)),
+                               check_stored, phase="save_offers")
+
+@metrics.timed("parse_page_source")
+def parse_page_source(page_source):
+    """Extract (game, server, price) offers from a page_source snapshot without the browser"""
+    tree = lxml_html.fromstring(page_source)
+    for game, server, price in zip(GAME_SELECTOR(tree), SERVER_SELECTOR(tree), PRICE_SELECTOR(tree)):
+        yield Offer(game.text_content().strip(), server.text_content().strip(), price.text_content().strip())
 
+@metrics.timed("click_next_page")
 def click_next_page(driver):
-    """Attempt to click the next page button with multiple safeguards"""
-    handle_cookie_popup(driver)  
-    
+    """Click Next; False when there is no next page, NavigationError if the page change failed"""
+    try:
+        next_button = pacer.until(driver, EC.element_to_be_clickable((By.CSS_SELECTOR, NEXT_PAGE_SELECTOR)),
+                                  observe=False)
+    except TimeoutException:
+        log.info("No clickable next button")
+        return False
     try:
-        next_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, 'a.page-link[aria-label="Next Page"]:not([aria-disabled="true"])'))
-        )
-        
         driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", next_button)
-        time.sleep(0.5)
-        driver.execute_script("arguments[0].click();", next_button)
+        pacer.pause()
+        with PageTransition(driver, (By.TAG_NAME, 'body'), (By.CSS_SELECTOR, '.offer-title-colum'), pacer=pacer):
+            driver.execute_script("arguments[0].click();", next_button)
         return True
-    except Exception as e:
-        print(f"Failed to click next button: {str(e)}")
-        return False
+    except WebDriverException as e:
+        raise checkpoints.NavigationError(f"Failed to click next button: {e}") from e
 
-def main():
-    page_num = 1
-    max_pages = 24
-    
-    # Establish database connection once
-    conn = connect_to_db()
-    if not conn:
-        print("Failed to connect to database. Exiting.")
-        return
-    
-    options = webdriver.ChromeOptions()
-    options.add_argument("--start-maximized")
-    driver = webdriver.Chrome(options=options)
-    driver.get("url/ website link ")
-    
+def create_driver(profile_dir=None):
+    """Start a browser on profile_dir (persistent when given) with consent pre-handled if possible"""
+    driver = driver_factory.create_driver(user_data_dir=profile_dir)
+    _profile_dirs[driver.session_id] = profile_dir
+
+    if profile_dir and consent_recorded(profile_dir):
+        _consent_handled.add(driver.session_id)
+    elif CONSENT_COOKIE:
+        driver.execute_cdp_cmd("Network.setCookie", CONSENT_COOKIE)
+        record_consent(driver, CONSENT_COOKIE.get("expires"))
+    return driver
+
+def open_page(driver, page_num):
+    """Load the listing and move to page_num, via PAGE_URL_TEMPLATE or by clicking Next"""
+    if PAGE_URL_TEMPLATE:
+        pacer.load(driver, PAGE_URL_TEMPLATE.format(page=page_num))
+        handle_cookie_popup(driver)
+        return True
+
+    pacer.load(driver, START_URL)
     handle_cookie_popup(driver)
+    for _ in range(page_num - 1):
+        if not click_next_page(driver):
+            return False
+    return True
 
+def scrape_page_range(first_page, last_page, sink, incremental=False, resume=False, profile_dir=None, check_stored=True,
+                      archive=None):
+    """Scrape first_page..last_page on a dedicated browser, returning {page: inserted count}"""
+    report = {}
+    driver = None
+    # Each shard keeps its own checkpoint, so --resume needs the same --workers and --max-pages
+    checkpoint_key = f"scraper3:{first_page}-{last_page}"
     try:
-        while page_num <= max_pages:
-            scrape_page(driver, page_num, conn)
-            
-            if not click_next_page(driver):
-                print("No more pages available or navigation failed")
+        if resume:
+            checkpoint = checkpoints.load(checkpoint_key, START_URL)
+            if checkpoint:
+                log.info("Resuming pages %s-%s after page %s", first_page, last_page, checkpoint[0])
+                first_page = checkpoint[0] + 1
+            if first_page > last_page:
+                checkpoints.finish(sink, checkpoint_key, START_URL)
+                return report
+
+        driver = create_driver(profile_dir)
+        with pacer.slot():
+            opened = open_page(driver, first_page)
+        if not opened:
+            log.error("Could not reach page %s", first_page)
+            return report
+
+        page_num = first_page
+        while page_num <= last_page:
+            metrics.set_page(page_num)
+            if archive:
+                archive.record_page(driver, page_num)
+            report[page_num] = scrape_page(driver, page_num, sink, check_stored, checkpoint_key)
+            if report[page_num] is None:
+                # Later pages would move the checkpoint past this one
+                log.error("Stopping pages %s-%s at page %s, keeping the checkpoint", first_page, last_page, page_num)
+                return report
+
+            if incremental and report[page_num] == 0:
+                log.info("Only already-stored offers on page %s, stopping.", page_num)
+                break
+
+            if page_num == last_page:
+                break
+            # Page loads wait for a slot, so only as many workers hit the site at once as it keeps up with
+            with pacer.slot():
+                advanced = click_next_page(driver)
+            if not advanced:
+                log.info("No more pages available")
                 break
-                
+
             page_num += 1
-            time.sleep(2)
-            handle_cookie_popup(driver)
+
+        checkpoints.finish(sink, checkpoint_key, START_URL)
+    except Exception as e:
+        log.error("Error in pages %s-%s: %s", first_page, last_page, e)
+    finally:
+        if driver:
+            _consent_handled.discard(driver.session_id)
+            _profile_dirs.pop(driver.session_id, None)
+            driver.quit()
+    return report
+
+def shard_pages(max_pages, workers):
+    """Split pages 1..max_pages into up to `workers` contiguous, disjoint ranges"""
+    workers = max(1, min(workers, max_pages))
+    size, extra = divmod(max_pages, workers)
+    ranges = []
+    first_page = 1
+    for n in range(workers):
+        last_page = first_page + size - 1 + (1 if n < extra else 0)
+        ranges.append((first_page, last_page))
+        first_page = last_page + 1
+    return ranges
+
+def print_report(report, max_pages):
+    log.info("Page report")
+    total = 0
+    for page_num in range(1, max_pages + 1):
+        if page_num not in report:
+            log.info("Page %s: not scraped", page_num)
+        elif report[page_num] is None:
+            log.info("Page %s: failed", page_num)
+        else:
+            log.info("Page %s: %s new records", page_num, report[page_num])
+            total += report[page_num]
+    log.info("Total new records: %s", total)
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape seller offers into seller_data")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of parallel browsers; how many load pages at once adapts to the site")
+    parser.add_argument("--max-pages", type=int, default=24)
+    parser.add_argument("--profile-dir", default=PROFILE_DIR,
+                        help="root for persistent Chrome profiles (one per worker); empty to use throwaway profiles")
+    parser.add_argument("--engine", choices=["selenium", "cdp"], default="selenium",
+                        help="drive Chrome through chromedriver, or directly over the DevTools protocol (needs websockets)")
+    parser.add_argument("--cdp-url", help="with --engine cdp, attach to this running Chrome (ws:// or http://host:port)")
+    file_sink.add_crawl_arguments(parser, INCREMENTAL, price_history=True)
+    file_sink.add_arguments(parser)
+    html_archive.add_arguments(parser)
+    args = parser.parse_args()
+    # Every shard shares the one writer and its connection
+    sink, conn = file_sink.create_sink(parser, args, TABLE_NAME, COLUMNS, PRICE_HISTORY_KEY)
+    if sink is None:
+        return
+    to_db = args.output == "postgres"
+    pacer.max_concurrency = max(1, args.workers)
+
+    archive = html_archive.create('scraper3', args.archive_dir) if args.record else None
+    report = {}
+    ranges = shard_pages(args.max_pages, args.workers)
+
+    try:
+        if args.engine == "cdp":
+            import cdp_engine
+            # One browser, one tab per worker, all driven from one event loop
+            report = cdp_engine.CdpScraper(sink, args.workers, to_db and not args.price_history, args.incremental,
+                                           args.resume, archive, args.cdp_url,
+                                           os.path.join(args.profile_dir, "cdp") if args.profile_dir else None
+                                           ).run(args.max_pages)
+        else:
+            with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                futures = [
+                    pool.submit(scrape_page_range, first_page, last_page, sink, args.incremental, args.resume,
+                                os.path.join(args.profile_dir, f"worker-{n}") if args.profile_dir else None,
+                                to_db and not args.price_history, archive)
+                    for n, (first_page, last_page) in enumerate(ranges)
+                ]
+                for future in as_completed(futures):
+                    report.update(future.result())
     
     except Exception as e:
-        print(f"Error in main scraping loop: {e}")
+        log.error("Error in main scraping loop: %s", e)
     finally:
-        driver.quit()
+        try:
+            sink.close()
+        except WriterError as e:
+            log.error("Error writing data: %s", e)
+        if archive:
+            archive.close()
+        print_report(report, args.max_pages)
+        metrics.write_reports('scraper3')
         if conn:
-            conn.close()
-            print("Database connection closed")
+            db.put_conn(conn)
+            db.close_pool()
+            log.info("Database connection closed")
+        command_trace.check_all()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
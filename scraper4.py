@@ -1,135 +1,160 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-import psycopg2
+import argparse
+import db
+import checkpoints
+import logs
+import metrics
+import driver_factory
+import command_trace
+import file_sink
+import normalize
+import html_archive
+import pacing
+import records
+from records import Feedback
 import sys
-import time
+from lxml import html as lxml_html
+from page_wait import PageTransition
+from prefetch import TabPrefetcher
+from db_writer import WriterError
 from selenium.common.exceptions import NoSuchElementException, WebDriverException, TimeoutException, StaleElementReferenceException
 
-# Database configuration
-DB_HOST = "localhost"
-DB_NAME = "data_scrap"
-DB_USER = "postgres"
-DB_PASSWORD = "password"
-DB_PORT = "5432"
+log = logs.get_logger("scraper4")
+
+pacer = pacing.Pacer("scraper4")
+
+START_URL = "url/ website link"
+TABLE_NAME = "feedback"
+COLUMNS = ('feedback_rating', 'comment', 'date', 'left_by', 'row_hash') + normalize.DATE_COLUMNS
+# Set to the paginated feedback URL (e.g. "url/ website link?page={page}") to render
+# the next page in a background tab while the current one is extracted
+PAGE_URL_TEMPLATE = None
+
+# Feedback is listed newest-first, so stop at the first page with nothing new (--incremental/--no-incremental)
+INCREMENTAL = True
+
+# Each child of this element is one feedback item
+FEEDBACK_CONTAINER_XPATH = '/html/body/main/div/div[1]/div/div[1]/div[4]/div/div/div[2]/div[2]/div[2]'
+
+# Item-relative XPaths: rating, comment, date, left by
+FEEDBACK_FIELD_XPATHS = ['div[1]/span', 'div[2]/div', 'div[4]', 'div[3]/div[2]/p']
+
+# Read every item of the resolved container in one round trip; null marks an item missing a field
+FEEDBACK_ROWS_SCRIPT = """
+const container = arguments[0];
+const fields = arguments[1];
+const rows = [];
+for (const item of container.children) {
+    const nodes = fields.map(path => document.evaluate(path, item, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue);
+    if (nodes.some(node => !node)) {
+        rows.push(null);
+        continue;
+    }
+    const [rating, comment, date, leftBy] = nodes;
+    rows.push([
+        (rating.getAttribute("title") || rating.innerText).trim(),
+        comment.innerText.trim(),
+        date.innerText.trim(),
+        leftBy.innerText.trim(),
+    ]);
+}
+return rows;
+"""
+
+# Re-resolve the container at most this many times if the page re-renders under us
+MAX_STALE_RETRIES = 3
 
 def setup_driver():
     try:
-        options = webdriver.ChromeOptions()
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        driver = webdriver.Chrome(options=options)
-        driver.maximize_window()  # Ensure all elements are visible
-        return driver
+        # Headless with a fixed 1920x1080 window, so all elements stay visible
+        return driver_factory.create_driver()
     except WebDriverException as e:
-        print(f"Failed to initialize WebDriver: {str(e)}")
+        log.error("Failed to initialize WebDriver: %s", e)
         sys.exit(1)
 
-def create_feedback_table(conn):
-    """Create the feedback table if it doesn't exist"""
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS feedback (
-                    id SERIAL PRIMARY KEY,
-                    feedback_rating VARCHAR(20),
-                    comment TEXT,
-                    date VARCHAR(50),
-                    left_by VARCHAR(100),
-                    scraped_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-        conn.commit()
-    except psycopg2.Error as e:
-        print(f"Error creating table: {e}")
-        conn.rollback()
-
-def insert_feedback(conn, feedback_data):
-    """Insert feedback data into the database"""
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute("""
-                INSERT INTO feedback (feedback_rating, comment, date, left_by)
-                VALUES (%s, %s, %s, %s)
-            """, feedback_data)
-        conn.commit()
-    except psycopg2.Error as e:
-        print(f"Error inserting feedback: {e}")
-        conn.rollback()
-
-def scrape_current_page(driver, conn):
-    """Scrape all feedback items on the current page"""
-    feedback_items = []
-    i = 1
-    
-    while True:
-        try:
-            # Construct XPaths - these might need adjustment based on actual page structure
-            xpath_base = f'/html/body/main/div/div[1]/div/div[1]/div[4]/div/div/div[2]/div[2]/div[2]/div[{i}]'
-            xpath_left_by = f'{xpath_base}/div[3]/div[2]/p'
-            xpath_feedback = f'{xpath_base}/div[1]/span'
-            xpath_comments = f'{xpath_base}/div[2]/div'
-            xpath_dates = f'{xpath_base}/div[4]'
-
-            # Find elements with timeout
-            feedback_element = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, xpath_feedback))
-            )
-            comment_element = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, xpath_comments))
-            )
-            date_element = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, xpath_dates))
-            )
-            left_by_element = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.XPATH, xpath_left_by))
-            )
-
-            # Extract data
-            feedback = feedback_element.get_attribute("title") or feedback_element.text
-            comment = comment_element.text
-            date = date_element.text
-            left_by = left_by_element.text.split("\n")[1] if "\n" in left_by_element.text else left_by_element.text
-
-            print(f'Feedback {i}: {feedback}, Comment: {comment[:30]}..., Date: {date}, Left by: {left_by}')
-
-            # Store in database
-            insert_feedback(conn, (feedback, comment, date, left_by))
-            
-            feedback_items.append({
-                'feedback': feedback,
-                'comment': comment,
-                'date': date,
-                'left_by': left_by
-            })
-            
-            i += 1
+def save_feedback(sink, feedback, check_stored=True, now=None):
+    """Stream the page's feedback that is not already stored to the sink, returning (seen, new, last item)"""
+    # Relative dates ("2 days ago") are resolved against now, the time of scraping by default
+    return records.stream_into(TABLE_NAME, feedback, lambda rows: sink.add_many(normalize.with_dates(rows, 2, now)),
+                               check_stored, phase="save_feedback")
 
-        except TimeoutException:
-            print(f"No more feedback entries found on this page at index {i}")
+@metrics.timed("scrape_current_page")
+def scrape_current_page(driver):
+    """Yield the feedback items on the current page"""
+    for attempt in pacer.attempts(MAX_STALE_RETRIES):
+        try:
+            # Resolve the list once; its child count is the page's item count
+            container = pacer.until(driver, EC.presence_of_element_located((By.XPATH, FEEDBACK_CONTAINER_XPATH)))
+            rows = driver.execute_script(FEEDBACK_ROWS_SCRIPT, container, FEEDBACK_FIELD_XPATHS)
             break
+        except TimeoutException:
+            log.info("No feedback list found on this page")
+            return
         except StaleElementReferenceException:
-            print(f"Stale element reference at index {i}, retrying...")
-            time.sleep(2)
+            log.warning("Feedback list went stale (attempt %s of %s), retrying...", attempt, MAX_STALE_RETRIES)
+            pacer.failure("stale_element")
+    else:
+        raise checkpoints.NavigationError("Feedback list kept going stale")
+
+    yield from feedback_items_from_rows(rows)
+
+def feedback_items_from_rows(rows):
+    """Turn [rating, comment, date, left by] rows (None for incomplete items) into Feedback records"""
+    extracted = 0
+    for i, row in enumerate(rows, start=1):
+        if row is None:
+            log.error("Error processing feedback %s: missing fields", i)
             continue
-        except Exception as e:
-            print(f"Error processing feedback {i}: {str(e)}")
-            i += 1
+
+        feedback, comment, date, left_by = row
+        left_by = left_by.split("\n")[1] if "\n" in left_by else left_by
+
+        log.debug("Feedback %s: %s, Comment: %s..., Date: %s, Left by: %s", i, feedback, comment[:30], date, left_by,
+                  extra={"row": i, "feedback_rating": feedback, "date": date, "left_by": left_by})
+
+        extracted += 1
+        yield Feedback(feedback, comment, date, left_by)
+
+    log.info("Extracted %s of %s feedback items", extracted, len(rows))
+
+@metrics.timed("parse_page_source")
+def parse_page_source(page_source):
+    """Extract feedback from a page_source snapshot without the browser, as scrape_current_page does live"""
+    tree = lxml_html.fromstring(page_source)
+    # innerText renders <br> as a newline, which the "Left by" split relies on
+    for br in tree.iter('br'):
+        br.tail = "\n" + (br.tail or "")
+
+    containers = tree.xpath(FEEDBACK_CONTAINER_XPATH)
+    if not containers:
+        log.info("No feedback list found on this page")
+        return
+
+    rows = []
+    for item in containers[0]:
+        nodes = [item.xpath(path) for path in FEEDBACK_FIELD_XPATHS]
+        if not all(nodes):
+            rows.append(None)
             continue
-    
-    return feedback_items
+        rating, comment, date, left_by = (found[0] for found in nodes)
+        rows.append([
+            (rating.get("title") or rating.text_content()).strip(),
+            comment.text_content().strip(),
+            date.text_content().strip(),
+            left_by.text_content().strip(),
+        ])
+    yield from feedback_items_from_rows(rows)
 
+@metrics.timed("go_to_next_page")
 def go_to_next_page(driver):
-    """Attempt to navigate to the next page of feedback"""
-    max_attempts = 3
-    attempts = 0
-    
-    while attempts < max_attempts:
+    """Click Next; False when there is no next page, NavigationError once every attempt failed"""
+    error = None
+    for attempt in pacer.attempts():
         try:
             # Scroll to bottom to ensure pagination controls are visible
             driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(1)
             
             # Try different ways to find the next button
             next_buttons = driver.find_elements(By.XPATH, '//a[contains(@class, "page-link") and contains(text(), "Next")]')
@@ -141,81 +166,107 @@ def go_to_next_page(driver):
                 next_buttons = driver.find_elements(By.XPATH, '//li[contains(@class, "next")]/a')
             
             if not next_buttons:
-                print("No next page button found")
+                log.warning("No next page button found")
                 return False
                 
             next_button = next_buttons[0]
             
             # Check if button is clickable
             if next_button.is_enabled() and next_button.is_displayed():
-                # Use JavaScript click to avoid element interception issues
-                driver.execute_script("arguments[0].click();", next_button)
-                time.sleep(3)  # Wait for page to load
-                
-                # Verify we actually moved to a new page
-                WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.XPATH, '//div[contains(@class, "feedback-item")]'))
-                )
+                # Use JavaScript click to avoid element interception issues,
+                # then wait until the old feedback list is replaced
+                with PageTransition(driver, (By.TAG_NAME, 'body'), (By.XPATH, '//div[contains(@class, "feedback-item")]'),
+                                    pacer=pacer):
+                    driver.execute_script("arguments[0].click();", next_button)
                 return True
             else:
-                print("Next button is not clickable")
+                log.warning("Next button is not clickable")
                 return False
                 
-        except Exception as e:
-            attempts += 1
-            print(f"Attempt {attempts} to go to next page failed: {str(e)}")
-            time.sleep(2)
-    
-    print(f"Failed to go to next page after {max_attempts} attempts")
-    return False
+        except WebDriverException as e:
+            log.warning("Attempt %s to go to next page failed: %s", attempt, e)
+            error = e
+            # Timeouts were already reported by the wait that raised them
+            if not isinstance(e, TimeoutException):
+                pacer.failure("navigation_error")
+
+    raise checkpoints.NavigationError(f"Failed to go to next page after {pacer.max_attempts} attempts: {error}")
 
 def main():
+    parser = argparse.ArgumentParser()
+    file_sink.add_crawl_arguments(parser, INCREMENTAL)
+    file_sink.add_arguments(parser)
+    html_archive.add_arguments(parser)
+    args = parser.parse_args()
+    sink, conn = file_sink.create_sink(parser, args, TABLE_NAME, COLUMNS)
+    if sink is None:
+        sys.exit(1)
+    to_db = args.output == "postgres"
+
     try:
         # Initialize WebDriver
         driver = setup_driver()
-        driver.get("url/ website link")
-        
-        # Connect to PostgreSQL database
-        try:
-            conn = psycopg2.connect(
-                dbname=DB_NAME,
-                user=DB_USER,
-                password=DB_PASSWORD,
-                host=DB_HOST,
-                port=DB_PORT
-            )
-            print("Database connection established successfully")
-        except psycopg2.Error as e:
-            print(f"Database connection failed: {e}")
-            driver.quit()
-            sys.exit(1)
-        
-        # Create table if not exists
-        create_feedback_table(conn)
+        pacer.load(driver, START_URL)
+        archive = html_archive.create('scraper4', args.archive_dir) if args.record else None
         
         page_number = 1
         max_pages = 10  # Safety limit to prevent infinite loops
+
+        if args.resume:
+            page_number = checkpoints.fast_forward(driver, 'scraper4', START_URL, go_to_next_page)
+            if page_number is None:
+                log.error("Could not reach the checkpointed page")
+                return
         
+        prefetcher = TabPrefetcher(driver, PAGE_URL_TEMPLATE, (By.XPATH, '//div[contains(@class, "feedback-item")]'), go_to_next_page,
+                                   pacer=pacer)
+
         while page_number <= max_pages:
-            print(f"\nScraping page {page_number}")
-            feedback_items = scrape_current_page(driver, conn)
+            metrics.set_page(page_number)
+            log.info("Scraping page %s", page_number, extra={"page": page_number})
+            if page_number < max_pages:
+                prefetcher.prefetch(page_number + 1)
+            if archive:
+                archive.record_page(driver, page_number)
+            seen, new_count, last = save_feedback(sink, scrape_current_page(driver), to_db)
             
-            if not feedback_items:
-                print("No feedback items found on this page")
+            if not seen:
+                log.info("No feedback items found on this page")
+                break
+
+            sink.checkpoint('scraper4', START_URL, page_number, seen)
+            log.info("Page %s: %s items, %s new, last left by %s", page_number, seen, new_count, last.left_by,
+                     extra={"page": page_number, "rows": seen, "new_rows": new_count})
+
+            if new_count == 0 and args.incremental:
+                log.info("No new feedback on this page, stopping")
                 break
                 
-            if not go_to_next_page(driver):
-                print("No more pages available")
+            if not prefetcher.advance(page_number + 1):
+                log.info("No more pages available")
                 break
                 
             page_number += 1
 
+        checkpoints.finish(sink, 'scraper4', START_URL)
+
+    except (checkpoints.NavigationError, WebDriverException) as e:
+        log.error("Stopped before the end of the listing, keeping the checkpoint: %s", e)
     finally:
         # Clean up resources
-        if 'conn' in locals():
-            conn.close()
+        try:
+            sink.close()
+        except WriterError as e:
+            log.error("Error writing feedback: %s", e)
+        if conn is not None:
+            db.put_conn(conn)
+        db.close_pool()
+        if locals().get('archive'):
+            archive.close()
         if 'driver' in locals():
             driver.quit()
+        metrics.write_reports('scraper4')
+        command_trace.check_all()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
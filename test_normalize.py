@@ -0,0 +1,96 @@
+from datetime import datetime
+import pytest
+import normalize
+
+NOW = datetime(2024, 3, 15, 12, 0, 0)
+
+
+@pytest.mark.parametrize("text, amount, currency", [
+    # Currencies by symbol and by code
+    ("$1,234.50", 1234.5, "USD"),
+    ("1.234,50 €", 1234.5, "EUR"),
+    ("£9.99", 9.99, "GBP"),
+    ("¥1,000", 1000.0, "JPY"),
+    ("₹1,23,456.00", 123456.0, "INR"),
+    ("12 USD", 12.0, "USD"),
+    ("CHF 1'234.50", 1234.5, "CHF"),
+    # Thousands separators
+    ("1,234,567", 1234567.0, None),
+    ("1.234.567", 1234567.0, None),
+    ("1.234.567,89", 1234567.89, None),
+    ("1,234", 1234.0, None),
+    ("1.234", 1234.0, None),
+    ("1 234,56 €", 1234.56, "EUR"),
+    ("1\xa0234,56 €", 1234.56, "EUR"),
+    ("1\u202f234,56", 1234.56, None),
+    # Decimal separators
+    ("12,5", 12.5, None),
+    ("€12,50", 12.5, "EUR"),
+    ("12.50", 12.5, None),
+    ("0.123", 0.12, None),
+    ("$10.37 Unit price", 10.37, "USD"),
+    # Out of NUMERIC(14, 2) range
+    ("12345678901234.5", None, None),
+    ("999999999999.99", 999999999999.99, None),
+    # Unparseable
+    ("Free", None, None),
+    ("", None, None),
+    (None, None, None),
+])
+def test_parse_prices(text, amount, currency):
+    amounts, currencies = normalize.parse_prices([text])
+    assert amounts == [amount]
+    assert currencies == [currency]
+
+
+def test_parse_prices_default_currency_only_for_parsed_amounts():
+    amounts, currencies = normalize.parse_prices(["12.50", "EUR 3", "n/a"], default_currency="USD")
+    assert amounts == [12.5, 3.0, None]
+    assert currencies == ["USD", "EUR", None]
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Relative to NOW
+    ("just now", NOW),
+    ("Today", NOW),
+    ("yesterday", datetime(2024, 3, 14, 12, 0, 0)),
+    ("5 seconds ago", datetime(2024, 3, 15, 11, 59, 55)),
+    ("a minute ago", datetime(2024, 3, 15, 11, 59, 0)),
+    ("an hour ago", datetime(2024, 3, 15, 11, 0, 0)),
+    ("2 days ago", datetime(2024, 3, 13, 12, 0, 0)),
+    (" 3 Weeks ago ", datetime(2024, 2, 23, 12, 0, 0)),
+    ("one month ago", datetime(2024, 2, 14, 12, 0, 0)),
+    ("1 year ago", datetime(2023, 3, 16, 12, 0, 0)),
+    # Absolute
+    ("2024-03-01", datetime(2024, 3, 1)),
+    ("2024-03-01 08:30", datetime(2024, 3, 1, 8, 30)),
+    ("2024-03-01T08:30:00+02:00", datetime(2024, 3, 1, 6, 30)),
+    # Unparseable
+    ("some time ago", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_dates(text, expected):
+    assert normalize.parse_dates([text], now=NOW) == [expected]
+
+
+def test_with_prices_and_dates_append_typed_columns():
+    assert normalize.with_prices([("game", "$5.00")], 1) == [("game", "$5.00", 5.0, "USD")]
+    assert normalize.with_dates([("5", "ok", "2 days ago", "bob")], 2, now=NOW) == [
+        ("5", "ok", "2 days ago", "bob", datetime(2024, 3, 13, 12, 0, 0))
+    ]
+    assert normalize.with_prices([], 1) == []
+
+
+@pytest.mark.parametrize("text, relative", [
+    ("2 days ago", True),
+    (" An hour ago ", True),
+    ("yesterday", True),
+    ("Just now", True),
+    ("2024-03-01", False),
+    ("some time ago", False),
+    ("", False),
+    (None, False),
+])
+def test_is_relative_date(text, relative):
+    assert normalize.is_relative_date(text) is relative